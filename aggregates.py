@@ -0,0 +1,61 @@
+import os, threading
+from datetime import datetime, timedelta
+from data_store import get_report_store
+
+# Per-user report counts, report dates and the top-K leaderboard, folded in
+# incrementally from the report store and shared by every session.
+class ReportAggregates:
+    def __init__(self, top_k=5):
+        self.top_k = top_k
+        self.version = None
+        self.seen = 0
+        self.counts = {}
+        self.dates = {}
+        self._first_seen = {}
+        self._top = []
+
+    def add(self, report):
+        if not isinstance(report, dict):
+            return
+        user = report.get('username', 'Unknown')
+        if user not in self._first_seen:
+            self._first_seen[user] = len(self._first_seen)
+        self.counts[user] = self.counts.get(user, 0) + 1
+        if report.get('timestamp'):
+            self.dates.setdefault(user, set()).add(report['timestamp'][:10])
+        # counts only grow, so only the user just bumped can enter the top-K
+        candidates = self._top if user in self._top else self._top + [user]
+        candidates.sort(key=lambda u: (-self.counts[u], self._first_seen[u]))
+        self._top = candidates[:self.top_k]
+
+    def user_count(self, username):
+        return self.counts.get(username, 0)
+
+    def user_streak(self, username, today=None):
+        dates = self.dates.get(username, ())
+        day = today or datetime.now().date()
+        streak = 0
+        while day.strftime("%Y-%m-%d") in dates:
+            streak += 1
+            day -= timedelta(days=1)
+        return streak
+
+    def leaderboard(self):
+        return [(u, self.counts[u]) for u in self._top]
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+def get_aggregates(base_dir):
+    store = get_report_store(base_dir)
+    key = os.path.abspath(base_dir)
+    with _aggregates_lock:
+        agg = _aggregates.get(key)
+        if agg is None:
+            agg = _aggregates[key] = ReportAggregates()
+        if agg.version != store.current_version():
+            agg.version, new_reports = store.since(agg.seen)
+            for report in new_reports:
+                agg.add(report)
+            agg.seen += len(new_reports)
+        return agg
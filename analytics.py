@@ -0,0 +1,176 @@
+import os, threading
+from array import array
+from datetime import datetime
+import numpy as np
+from data_store import get_report_store
+
+STATUS_CODES = {"Pending": 0, "In Progress": 1, "Resolved": 2}
+OPEN = (0, 1)
+
+def _epoch(ts):
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return float("nan")
+
+def _gaussian(radius, sigma):
+    x = np.arange(-radius, radius + 1, dtype=float)
+    k = np.exp(-0.5 * (x / sigma) ** 2)
+    return k / k.sum()
+
+# Column store (lat, lon, created, resolved, status) over every report, a
+# grid index of per-cell status counts, and the analytics built on top.
+# sync() folds in store deltas incrementally; a compaction triggers a rebuild.
+class AnalyticsEngine:
+    CELL_DEG = 0.01  # ~1.1 km at the equator
+
+    def __init__(self, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.cursor = None
+        self._rows = {}
+        self._lat, self._lon = array("d"), array("d")
+        self._created, self._resolved = array("d"), array("d")
+        self._status = array("b")
+        self.cells = {}
+        self._cache = {}
+
+    def _cell(self, row):
+        lat, lon = self._lat[row], self._lon[row]
+        if lat != lat or lon != lon:  # NaN: not located yet
+            return None
+        return (int(lat // self.cell_deg), int(lon // self.cell_deg))
+
+    def _count(self, row, delta):
+        cell = self._cell(row)
+        if cell is None:
+            return
+        counts = self.cells.setdefault(cell, [0, 0, 0, 0])
+        counts[3] += delta
+        status = self._status[row]
+        if 0 <= status <= 2:
+            counts[status] += delta
+        if counts[3] == 0:
+            del self.cells[cell]
+
+    def _put(self, report):
+        row = self._rows.get(report["id"])
+        if row is None:
+            row = self._rows[report["id"]] = len(self._status)
+            for col in (self._lat, self._lon, self._created, self._resolved):
+                col.append(float("nan"))
+            self._status.append(-1)
+            self._created[row] = _epoch(report.get("timestamp"))
+        else:
+            self._count(row, -1)
+        lat, lon = report.get("lat"), report.get("lon")
+        self._lat[row] = float("nan") if lat is None else float(lat)
+        self._lon[row] = float("nan") if lon is None else float(lon)
+        # flagged duplicates stay out of the backlog and hotspots
+        self._status[row] = 3 if report.get("duplicate_of") else STATUS_CODES.get(report.get("status", "Pending"), 3)
+        self._resolved[row] = _epoch(report.get("resolved_at")) if self._status[row] == 2 else float("nan")
+        self._count(row, 1)
+
+    def sync(self, store):
+        with self._lock:
+            cursor, deltas = store.changes_since(self.cursor)
+            if cursor == self.cursor:
+                return
+            if deltas is None:
+                self._clear()
+                cursor = store.cursor()
+                for report in store.iter():
+                    self._put(report)
+            else:
+                for _kind, report, _fields in deltas:
+                    self._put(report)
+            self.cursor = cursor
+            self._cache = {}
+
+    def _columns(self):
+        n = len(self._status)
+        return (np.frombuffer(self._lat, dtype=float, count=n), np.frombuffer(self._lon, dtype=float, count=n),
+                np.frombuffer(self._created, dtype=float, count=n), np.frombuffer(self._resolved, dtype=float, count=n),
+                np.frombuffer(self._status, dtype=np.int8, count=n))
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    def hotspots(self, top=10, bandwidth_km=1.5, max_cells=800, open_only=True):
+        # Gaussian kernel density on a grid over the located (open) reports;
+        # returns the strongest local maxima as dicts with lat/lon/density.
+        def compute():
+            lat, lon, _, _, status = self._columns()
+            mask = ~np.isnan(lat) & ~np.isnan(lon)
+            if open_only:
+                mask &= np.isin(status, OPEN)
+            lat, lon = lat[mask], lon[mask]
+            if not len(lat):
+                return []
+            south, west = lat.min(), lon.min()
+            span = max(lat.max() - south, lon.max() - west, self.cell_deg)
+            cell = max(self.cell_deg, span / max_cells)
+            ny = int((lat.max() - south) // cell) + 1
+            nx = int((lon.max() - west) // cell) + 1
+            grid = np.zeros((ny, nx))
+            np.add.at(grid, (((lat - south) // cell).astype(int), ((lon - west) // cell).astype(int)), 1)
+            sigma = max(bandwidth_km / (111.0 * cell), 0.5)
+            radius = int(3 * sigma) + 1
+            kernel = _gaussian(radius, sigma)
+            padded = np.pad(grid, radius)
+            smooth = np.apply_along_axis(np.convolve, 0, padded, kernel, mode="same")
+            smooth = np.apply_along_axis(np.convolve, 1, smooth, kernel, mode="same")[radius:-radius, radius:-radius]
+            peaks = []
+            for flat in np.argsort(smooth, axis=None)[::-1]:
+                y, x = divmod(int(flat), nx)
+                if smooth[y, x] <= 0 or len(peaks) >= top:
+                    break
+                if any(abs(y - py) <= radius and abs(x - px) <= radius for py, px, _ in peaks):
+                    continue
+                peaks.append((y, x, float(smooth[y, x])))
+            return [{"lat": float(south + (y + 0.5) * cell), "lon": float(west + (x + 0.5) * cell),
+                     "density": round(d, 2), "reports": int(grid[max(0, y - radius):y + radius + 1,
+                                                                 max(0, x - radius):x + radius + 1].sum())}
+                    for y, x, d in peaks]
+        return self._cached(("hotspots", top, bandwidth_km, max_cells, open_only), compute)
+
+    def backlog(self, top=20):
+        # cells with the most open (pending + in progress) reports
+        def compute():
+            rows = [{"lat": (cy + 0.5) * self.cell_deg, "lon": (cx + 0.5) * self.cell_deg,
+                     "pending": c[0], "in_progress": c[1], "resolved": c[2], "open": c[0] + c[1]}
+                    for (cy, cx), c in self.cells.items() if c[0] + c[1]]
+            rows.sort(key=lambda r: -r["open"])
+            return rows[:top]
+        return self._cached(("backlog", top), compute)
+
+    def resolution_stats(self, percentiles=(50, 90, 95)):
+        # hours from submission to resolution, for reports resolved with a timestamp
+        def compute():
+            _, _, created, resolved, status = self._columns()
+            hours = (resolved - created)[(status == 2) & ~np.isnan(resolved) & ~np.isnan(created)] / 3600
+            hours = hours[hours >= 0]
+            stats = {"resolved": int(len(hours)), "open": int(np.isin(status, OPEN).sum())}
+            if len(hours):
+                stats.update({f"p{p}_hours": round(float(v), 1) for p, v in zip(percentiles, np.percentile(hours, percentiles))})
+            return stats
+        return self._cached(("resolution", tuple(percentiles)), compute)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_analytics(base_dir):
+    store = get_report_store(base_dir)
+    key = os.path.abspath(base_dir)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = AnalyticsEngine()
+    engine.sync(store)
+    return engine
@@ -1,6 +1,9 @@
 import streamlit as st
-from ui import show_home_page, show_login_page, show_signup_page, main_app
+from ui import show_home_page, show_login_page, show_signup_page, main_app, BASE_DIR
 import os, time
+import metrics
+from auth import calibrate_in_background
+from jobs import get_job_queue
 
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
@@ -8,6 +11,14 @@ if 'logged_in' not in st.session_state:
     st.session_state.page = 'home'
 
 def main():
+    metrics.serve_from_env()
+    calibrate_in_background()
+    get_job_queue(BASE_DIR)  # starts the dispatcher, resuming jobs left pending
+    metrics.begin_rerun()
+    with metrics.span(f"rerun.{st.session_state.page}"):
+        render_page()
+
+def render_page():
     if st.session_state.page == 'home':
         show_home_page()
     elif st.session_state.page == 'login':
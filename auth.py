@@ -1,65 +1,218 @@
 
-import hashlib
-from data_store import load_json_file, save_json_file, get_default_files
+import base64, hashlib, hmac, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from data_store import get_backend, get_default_files, load_json_file, save_json_atomic, file_lock
+from ledger import get_ledger
 import os
+from metrics import timed
+
+# --- Password hashing ---
+# Stored formats: "scrypt$<n>$<r>$<p>$<salt>$<hash>", "pbkdf2_sha256$<iters>$<salt>$<hash>"
+# (base64 salt/hash), or a bare 64-char hex SHA-256 from before salting, which
+# still verifies and is re-hashed on the next successful login.
+KDF = os.environ.get('SWACHHMAP_KDF', 'scrypt')
+KDF_TARGET_MS = float(os.environ.get('SWACHHMAP_KDF_TARGET_MS', '60'))
+VERIFY_WORKERS = int(os.environ.get('SWACHHMAP_VERIFY_WORKERS', '2'))
+_kdf_params = {}
+_kdf_lock = threading.Lock()
+_verify_pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix='password-verify')
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+def _timed_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+def calibrate_kdf(target_ms=None):
+    # picks the largest cost that stays around target_ms per hash on this host
+    target_ms = target_ms or KDF_TARGET_MS
+    salt = os.urandom(16)
+    if KDF == 'pbkdf2':
+        iterations = 20000
+        elapsed = _timed_ms(lambda: _pbkdf2('calibrate', salt, iterations))
+        return {'iterations': max(20000, int(iterations * target_ms / max(elapsed, 0.01)))}
+    n, r, p = 1 << 12, 8, 1
+    while n < (1 << 17) and _timed_ms(lambda: _scrypt('calibrate', salt, n * 2, r, p)) <= target_ms:
+        n *= 2
+    return {'n': n, 'r': r, 'p': p}
+
+def kdf_params():
+    with _kdf_lock:
+        if not _kdf_params:
+            _kdf_params.update(calibrate_kdf())
+        return dict(_kdf_params)
+
+def calibrate_in_background():
+    # called at app startup so the first login or signup does not pay for
+    # calibration; requests arriving before it finishes wait on _kdf_lock
+    if not _kdf_params:
+        threading.Thread(target=kdf_params, name='kdf-calibrate', daemon=True).start()
 
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    salt = os.urandom(16)
+    b64 = lambda raw: base64.b64encode(raw).decode()
+    params = kdf_params()
+    if KDF == 'pbkdf2':
+        return f"pbkdf2_sha256${params['iterations']}${b64(salt)}${b64(_pbkdf2(password, salt, params['iterations']))}"
+    n, r, p = params['n'], params['r'], params['p']
+    return f"scrypt${n}${r}${p}${b64(salt)}${b64(_scrypt(password, salt, n, r, p))}"
+
+@timed("auth.verify_password")
+def verify_password(password, stored):
+    # returns (matches, needs_rehash)
+    stored = stored or ''
+    parts = stored.split('$')
+    try:
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = _scrypt(password, base64.b64decode(parts[4]), n, r, p)
+            ok = hmac.compare_digest(digest, base64.b64decode(parts[5]))
+            return ok, KDF != 'scrypt' or n < kdf_params()['n']
+        if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            iterations = int(parts[1])
+            digest = _pbkdf2(password, base64.b64decode(parts[2]), iterations)
+            ok = hmac.compare_digest(digest, base64.b64decode(parts[3]))
+            return ok, KDF != 'pbkdf2' or iterations < kdf_params()['iterations']
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy.encode(), stored.encode()), True
+    except (ValueError, TypeError):
+        return False, False
+
+def is_legacy_hash(stored):
+    return isinstance(stored, str) and '$' not in stored
+
+def normalize_user(entry):
+    if isinstance(entry, dict) and 'password' in entry:
+        return entry
+    if isinstance(entry, dict) and 'tokens' in entry:
+        return dict(entry, password=None)  # hash scrubbed from users.json
+    return {'password': entry, 'tokens': 0}
+
+# Process-wide user directory: users.json is normalized and imported into the
+# backend's "users" stream once; afterwards only new events are replayed. Once
+# imported, the unsalted SHA-256 hashes are scrubbed from users.json (the
+# balances stay, they seed the ledger).
+class UserDirectory:
+    def __init__(self, base_dir):
+        self.users_path = get_default_files(base_dir)['USER_FILE']
+        self._lock = threading.RLock()
+        self._log = get_backend(base_dir).event_log('users', self._apply, self._reset)
+        self._reset()
+        with self._lock:
+            self._log.create(self._legacy_events)
+            self._log.refresh()
+            self._scrub_users_file()
+
+    def current_version(self):
+        with self._lock:
+            self._log.refresh()
+            return self._log.version
+
+    def _reset(self):
+        self._users = {}
+
+    def _legacy_events(self):
+        users = {k: normalize_user(v) for k, v in load_json_file(self.users_path, {}).items()}
+        return [{'op': 'add', 'username': k, 'record': v} for k, v in users.items()]
+
+    def _scrub_users_file(self):
+        # users already in the stream lose their legacy hash in the file
+        with file_lock(self.users_path):
+            raw = load_json_file(self.users_path, {})
+            users = {}
+            for username, entry in raw.items():
+                entry = normalize_user(entry)
+                if username in self._users and is_legacy_hash(entry.get('password')):
+                    entry = {k: v for k, v in entry.items() if k != 'password'}
+                users[username] = entry
+            if users != raw:
+                save_json_atomic(self.users_path, users)
+
+    def _apply(self, event):
+        username = event.get('username')
+        if event.get('op') == 'add' and username in self._users:
+            return
+        if event.get('op') in ('add', 'set'):
+            self._users[username] = normalize_user(event.get('record'))
+
+    def get(self, username):
+        with self._lock:
+            self._log.refresh()
+            return self._users.get(username)
+
+    def all(self):
+        with self._lock:
+            self._log.refresh()
+            return dict(self._users)
+
+    def insert(self, username, record):
+        record = normalize_user(record)
+        with self._lock:
+            self._log.refresh()
+            if username in self._users:
+                return False
+            self._log.append([{'op': 'add', 'username': username, 'record': record}])
+            self._log.refresh()
+            return self._users.get(username) == record
+
+    def set(self, username, record):
+        with self._lock:
+            self._log.append([{'op': 'set', 'username': username, 'record': normalize_user(record)}])
+            self._log.refresh()
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def get_user_directory(base_dir):
+    key = os.path.abspath(base_dir)
+    with _directories_lock:
+        if key not in _directories:
+            _directories[key] = UserDirectory(base_dir)
+        return _directories[key]
 
 def load_users(base_dir):
-    paths = get_default_files(base_dir)
-    u = load_json_file(paths['USER_FILE'], {})
-    normalized = {}
-    for k, v in u.items():
-        if isinstance(v, dict) and 'password' in v:
-            normalized[k] = v
-        else:
-            normalized[k] = {'password': v, 'tokens': 0}
-    return normalized
+    return get_user_directory(base_dir).all()
 
 def save_users(users_dict, base_dir):
-    paths = get_default_files(base_dir)
-    save_json_file(paths['USER_FILE'], users_dict)
+    directory = get_user_directory(base_dir)
+    current = directory.all()
+    for username, entry in users_dict.items():
+        if current.get(username) != entry:
+            directory.set(username, entry)
 
+@timed("auth.signup")
 def save_user(username, password, base_dir):
-    users = load_users(base_dir)
-    if username in users:
-        return False
-    users[username] = {'password': hash_password(password), 'tokens': 0}
-    save_users(users, base_dir)
-    return True
+    return get_user_directory(base_dir).insert(username, {'password': hash_password(password), 'tokens': 0})
 
+@timed("auth.authenticate")
 def authenticate_user(username, password, base_dir):
-    users = load_users(base_dir)
-    entry = users.get(username)
+    directory = get_user_directory(base_dir)
+    entry = directory.get(username)
     if not entry:
         return False
-    return entry.get('password') == hash_password(password)
+    # KDF work runs on a small fixed pool so a login burst queues instead of
+    # pinning every server thread
+    ok, needs_rehash = _verify_pool.submit(verify_password, password, entry.get('password')).result()
+    if ok and needs_rehash:
+        new_hash = _verify_pool.submit(hash_password, password).result()
+        directory.set(username, dict(entry, password=new_hash))
+    return ok
 
-# Token management
+# Token management: balances live in the ledger (see ledger.py)
 def load_tokens(base_dir):
-    paths = get_default_files(base_dir)
-    tokens = load_json_file(paths['TOKENS_FILE'], {})
-    return tokens
-
-def save_tokens(tokens, base_dir):
-    paths = get_default_files(base_dir)
-    save_json_file(paths['TOKENS_FILE'], tokens)
+    return get_ledger(base_dir).balances()
 
-def add_tokens(username, amount, base_dir):
+@timed("auth.add_tokens")
+def add_tokens(username, amount, base_dir, reason="manual", key=None):
     if not username:
         return
-    tokens = load_tokens(base_dir)
-    tokens[username] = tokens.get(username, 0) + amount
-    save_tokens(tokens, base_dir)
-    users = load_users(base_dir)
-    if username in users:
-        users[username]['tokens'] = tokens[username]
-        save_users(users, base_dir)
+    get_ledger(base_dir).credit(username, amount, reason, key=key)
 
+@timed("auth.get_tokens")
 def get_user_tokens(username, base_dir):
-    tokens = load_tokens(base_dir)
-    if username in tokens:
-        return tokens[username]
-    users = load_users(base_dir)
-    return users.get(username, {}).get('tokens', 0)
+    return get_ledger(base_dir).balance(username)
@@ -0,0 +1,236 @@
+import argparse, importlib.util, json, os, platform, random, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+LOCATIONS = ["Kolkata", "Salt Lake", "New Town", "Howrah", "Deganga", "Barasat", "Dum Dum", "Garia"]
+STATUSES = ["Pending", "In Progress", "Resolved"]
+
+def synthetic_photo(rng, size=(640, 480)):
+    # JPEG bytes of a blocky, noisy photo-like image; Pillow is only needed
+    # for images, so it is imported here
+    from PIL import Image
+    import io
+    w, h = size
+    base = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    texture = Image.frombytes("L", (w // 8, h // 8), rng.randbytes(w // 8 * h // 8)).resize(size).convert("RGB")
+    buf = io.BytesIO()
+    Image.blend(base, texture, 0.4).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+def generate(base_dir, n_reports, n_users=None, n_images=None, seed=42):
+    # writes legacy users.json / reports.json / user_tokens.json and a few
+    # uploads (real JPEGs; none without Pillow); the stores import them on
+    # first open like a real deployment.
+    # Refuses a non-empty directory: existing data would be overwritten, or
+    # (reports.jsonl, swachhmap.db) silently measured instead.
+    import hashlib
+    if os.path.isdir(base_dir) and os.listdir(base_dir):
+        raise FileExistsError(f"{base_dir} is not empty")
+    rng = random.Random(seed)
+    n_users = n_users or max(10, n_reports // 20)
+    n_images = n_images if n_images is not None else min(200, n_reports // 10)
+    if importlib.util.find_spec("PIL") is None:
+        n_images = 0
+    os.makedirs(os.path.join(base_dir, "uploads"), exist_ok=True)
+    users = {f"user{i}": {"password": hashlib.sha256(f"pw{i}".encode()).hexdigest(), "tokens": 0}
+             for i in range(n_users)}
+    images = []
+    for i in range(n_images):
+        name = f"synthetic_{i}.jpg"
+        with open(os.path.join(base_dir, "uploads", name), "wb") as f:
+            f.write(synthetic_photo(rng, (rng.choice([640, 1024, 1600]), 480 + 8 * rng.randrange(60))))
+        images.append(name)
+    start = datetime(2025, 1, 1)
+    tokens = {}
+    with open(os.path.join(base_dir, "reports.json"), "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(n_reports):
+            user = f"user{int(rng.paretovariate(1.2)) % n_users}"
+            loc = rng.choice(LOCATIONS)
+            report = {
+                "username": user,
+                "location": f"{loc} {rng.randint(1, 400)}",
+                "description": "Garbage dump near the road",
+                "image": rng.choice(images) if images and rng.random() < 0.3 else None,
+                "timestamp": (start + timedelta(seconds=i * 37)).isoformat(),
+                "status": rng.choice(STATUSES),
+                "lat": 22.3 + rng.random() * 0.6,
+                "lon": 88.1 + rng.random() * 0.6,
+            }
+            tokens[user] = tokens.get(user, 0) + 10
+            f.write(("," if i else "") + json.dumps(report))
+        f.write("]")
+    with open(os.path.join(base_dir, "users.json"), "w", encoding="utf-8") as f:
+        json.dump(users, f)
+    with open(os.path.join(base_dir, "user_tokens.json"), "w", encoding="utf-8") as f:
+        json.dump(tokens, f)
+    return n_users
+
+def _bytes_written():
+    # /proc/self/io is Linux-only; elsewhere bytes are not reported
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(l for l in f if l.startswith("wchar")).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def measure(fn, iterations):
+    latencies = []
+    before = _bytes_written()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t) * 1000)
+    after = _bytes_written()
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+    return {
+        "iterations": iterations,
+        "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(latencies[-1], 4),
+        "bytes_written": None if before is None else after - before,
+        # high-water mark of the whole benchmark process so far, not of this op
+        "process_peak_rss_kb": _peak_rss_kb(),
+    }
+
+def run(base_dir, n_users, iterations=200):
+    import auth, data_store
+    from aggregates import get_aggregates
+    results = {}
+    results["store.cold_load"] = measure(lambda i: data_store.ReportStore(base_dir).all(), 3)
+    store = data_store.get_report_store(base_dir)
+    results["ui.load_reports"] = measure(lambda i: store.all(), iterations)
+    results["ui.save_report"] = measure(lambda i: store.append({
+        "username": f"user{i % n_users}", "location": "Kolkata 1", "description": "bench",
+        "image": None, "timestamp": datetime.now().isoformat(), "status": "Pending"}), iterations)
+
+    def view_filter(i):
+        # real substrings of generated locations: part of a name, or a name
+        # plus the leading digits of its number ("kolkata 12")
+        loc = LOCATIONS[i % len(LOCATIONS)].lower()
+        text = loc[i % 3:i % 3 + 4] if i % 2 else f"{loc} {i % 40 + 1}"
+        positions = store.find(status=STATUSES[i % 3], text=text)
+        store.page(None, 10, positions)
+    results["view_reports.filter"] = measure(view_filter, iterations)
+
+    def sidebar(i):
+        agg = get_aggregates(base_dir)
+        agg.user_count(f"user{i % n_users}")
+        agg.user_streak(f"user{i % n_users}")
+        agg.leaderboard()
+        auth.get_user_tokens(f"user{i % n_users}", base_dir)
+    results["sidebar.aggregates"] = measure(sidebar, iterations)
+    results["auth.add_tokens"] = measure(lambda i: auth.add_tokens(f"user{i % n_users}", 10, base_dir), iterations)
+    results["auth.authenticate_user"] = measure(
+        lambda i: auth.authenticate_user(f"user{i % n_users}", f"pw{i % n_users}", base_dir), min(iterations, 20))
+    if importlib.util.find_spec("PIL") is None:
+        results["upload.store_and_thumbnail"] = {"skipped": "Pillow not installed"}
+    else:
+        from uploads import make_thumbnail, store_upload
+        rng = random.Random(7)
+        photos = [synthetic_photo(rng, (1600, 1200)) for _ in range(min(iterations, 20))]
+        results["upload.store_and_thumbnail"] = measure(
+            lambda i: make_thumbnail(base_dir, store_upload(base_dir, photos[i], "photo.jpg")), len(photos))
+    try:
+        from map_data import get_map_index
+    except ImportError:
+        results["map_data.prepare"] = {"skipped": "numpy/pandas not installed"}
+    else:
+        def map_prepare(i):
+            if i % 10 == 0:
+                store.update_status(store.all()[-1]["id"], STATUSES[i % 3])
+            get_map_index(base_dir).visible((22.3, 88.1, 22.9, 88.7), 12)
+        results["map_data.prepare"] = measure(map_prepare, min(iterations, 50))
+    return results
+
+def _import_cmd(module, profile=False):
+    return [sys.executable] + (["-X", "importtime"] if profile else []) + ["-c", f"import {module}"]
+
+def import_profile(module="ui", runs=5, top=15):
+    # cold-start cost of `import module` in fresh interpreters, plus the
+    # slowest imports by cumulative time as reported by -X importtime
+    root = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(_import_cmd(module, profile=True), cwd=root, capture_output=True, text=True)
+    if proc.returncode:
+        return None, {"skipped": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"}
+    modules = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        modules.append({"module": parts[2].strip(), "self_ms": round(int(parts[0].split(":")[1]) / 1000, 2),
+                        "cumulative_ms": round(int(parts[1]) / 1000, 2)})
+    modules.sort(key=lambda m: -m["cumulative_ms"])
+    cold = measure(lambda i: subprocess.run(_import_cmd(module), cwd=root, capture_output=True, check=True), runs)
+    return cold, {"module": module, "imported": len(modules), "top": modules[:top]}
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold=0.2):
+    # ops whose p95 grew by more than `threshold` against a previous run
+    regressions = []
+    for op, res in new["results"].items():
+        prev = old.get("results", {}).get(op, {})
+        if "p95_ms" in res and prev.get("p95_ms"):
+            change = res["p95_ms"] / prev["p95_ms"] - 1
+            if change > threshold:
+                regressions.append((op, prev["p95_ms"], res["p95_ms"], change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the SwachhMap hot paths.")
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--base-dir", help="data directory to use (default: a fresh temp dir)")
+    parser.add_argument("--storage", choices=["sqlite", "json"], help="storage backend (SWACHHMAP_STORAGE)")
+    parser.add_argument("--out", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results; exits 1 on p95 regressions over 20%%")
+    args = parser.parse_args(argv)
+    if args.storage:
+        os.environ["SWACHHMAP_STORAGE"] = args.storage
+    if args.base_dir and os.path.isdir(args.base_dir) and os.listdir(args.base_dir):
+        parser.error(f"--base-dir {args.base_dir} is not empty; use a new or empty directory")
+    base_dir = args.base_dir or tempfile.mkdtemp(prefix="swachhmap-bench-")
+
+    t = time.perf_counter()
+    n_users = generate(base_dir, SCALES[args.scale])
+    generated_s = time.perf_counter() - t
+    output = {
+        "meta": {
+            "commit": _git_commit(), "scale": args.scale, "storage": os.environ.get("SWACHHMAP_STORAGE", "sqlite"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "generated_s": round(generated_s, 2), "timestamp": datetime.now().isoformat(), "base_dir": base_dir,
+        },
+        "results": run(base_dir, n_users, args.iterations),
+    }
+    cold, output["import_profile"] = import_profile()
+    output["results"]["startup.import_ui"] = cold or output["import_profile"]
+    text = json.dumps(output, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), output)
+        for op, before, after, change in regressions:
+            print(f"REGRESSION {op}: p95 {before:.3f}ms -> {after:.3f}ms (+{change:.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
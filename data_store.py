@@ -1,7 +1,12 @@
-
-import json, os
+import json, os, queue, sqlite3, threading, hashlib, uuid
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from report_index import ReportIndex
+from metrics import timed
 
+@timed("json.load")
 def load_json_file(path, default):
     if os.path.exists(path):
         try:
@@ -11,16 +16,594 @@ def load_json_file(path, default):
             return default
     return default
 
+@timed("json.save")
 def save_json_file(path, data):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
+@timed("json.save")
+def save_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
 # helpers for app to access default file names
 def get_default_files(base_dir):
     return {
         "USER_FILE": os.path.join(base_dir, "users.json"),
         "REPORT_FILE": os.path.join(base_dir, "reports.json"),
+        "REPORT_LOG": os.path.join(base_dir, "reports.jsonl"),
         "TOKENS_FILE": os.path.join(base_dir, "user_tokens.json"),
+        "TOKEN_LEDGER": os.path.join(base_dir, "token_ledger.jsonl"),
         "UPLOAD_DIR": os.path.join(base_dir, "uploads"),
-        "GEOCACHE_FILE": os.path.join(base_dir, "geocache.json")
+        "GEOCACHE_FILE": os.path.join(base_dir, "geocache.json"),
+        "DATABASE": os.path.join(base_dir, "swachhmap.db")
     }
+
+def new_report_id():
+    return uuid.uuid4().hex[:16]
+
+def legacy_report_id(report):
+    # deterministic so every process backfills the same id for old records
+    key = "|".join(str(report.get(k, "")) for k in ("username", "timestamp", "location"))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def _encode_event(event):
+    return (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+@contextmanager
+def file_lock(path):
+    # exclusive advisory lock on "<path>.lock", shared by every writer process
+    with open(path + ".lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+# Append-only JSONL file (one event per line) that is replayed once into the
+# owner's memory; later refreshes only read what other writers appended.
+# `reset` is called when the file was rewritten (compacted) underneath us.
+class EventLog:
+    def __init__(self, path, apply, reset, durable=False):
+        self.path = path
+        self.durable = durable
+        self.events = 0
+        self.version = 0
+        self._apply = apply
+        self._reset = reset
+        self._offset = 0
+        self._inode = None
+
+    @timed("store.log_refresh")
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._reset()
+            self.events = 0
+            self._offset = 0
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # another writer is mid-append; pick it up next time
+                self._offset += len(line)
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self.events += 1
+                self._apply(event)
+        self.version += 1
+        return True
+
+    @timed("store.log_append")
+    def append(self, events):
+        data = b"".join(_encode_event(e) for e in events)
+        with file_lock(self.path):
+            with open(self.path, "a+b") as f:
+                self._drop_torn_tail(f)
+                f.write(data)
+                if self.durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    @timed("store.log_append")
+    def append_checked(self, make_events):
+        # Check-then-append as one step across processes: catches up under
+        # the lock, then writes whatever make_events() returns (maybe nothing).
+        with file_lock(self.path):
+            self.refresh()
+            events = list(make_events())
+            if events:
+                with open(self.path, "a+b") as f:
+                    self._drop_torn_tail(f)
+                    f.write(b"".join(_encode_event(e) for e in events))
+                    if self.durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+            return events
+
+    @staticmethod
+    def _drop_torn_tail(f):
+        # A writer that crashed mid-append leaves a last line without "\n";
+        # truncate it (under the lock) so the next event starts a fresh line.
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
+
+    def _write(self, events):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for e in events:
+                f.write(_encode_event(e))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._inode = None
+
+    def create(self, make_events):
+        # seeds the log once (e.g. from a legacy JSON file) if it does not exist
+        with file_lock(self.path):
+            if not os.path.exists(self.path):
+                self._write(make_events())
+
+    def rewrite(self, make_events):
+        # compaction: make_events() runs after catching up, under the lock
+        with file_lock(self.path):
+            self.refresh()
+            self._write(list(make_events()))
+
+# --- Storage backends ---
+# Stores (reports, users, token ledger, jobs) keep their state in memory and
+# persist it as an event stream; every process replays it and then follows the tail.
+# SWACHHMAP_STORAGE picks the backend: "sqlite" (default) or "json".
+class JsonBackend:
+    name = "json"
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.paths = get_default_files(base_dir)
+
+    def event_log(self, stream, apply, reset, durable=False):
+        return EventLog(os.path.join(self.base_dir, stream + ".jsonl"), apply, reset, durable)
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, stream TEXT NOT NULL, body TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS events_stream ON events (stream, seq);
+CREATE TABLE IF NOT EXISTS streams (stream TEXT PRIMARY KEY, generation INTEGER NOT NULL);
+"""
+
+class ConnectionPool:
+    # a handful of WAL-mode connections per process, handed out per call
+    def __init__(self, path, size=4):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self, durable=False):
+        # durable commits also fsync the WAL, like EventLog(durable=True)
+        with self.connection() as conn:
+            if durable:
+                conn.execute("PRAGMA synchronous=FULL")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+
+# Same interface as EventLog, backed by the `events` table. A stream's
+# generation is bumped on rewrite so followers know to replay from scratch.
+class SQLiteEventLog:
+    def __init__(self, backend, stream, apply, reset, durable=False):
+        self.backend = backend
+        self.stream = stream
+        self.durable = durable
+        self.events = 0
+        self.version = 0
+        self._apply = apply
+        self._reset = reset
+        self._seq = 0
+        self._generation = None
+
+    @timed("store.log_refresh")
+    def refresh(self):
+        with self.backend.pool.connection() as conn:
+            return self._catch_up(conn)
+
+    def _catch_up(self, conn):
+        row = conn.execute("SELECT generation FROM streams WHERE stream = ?", (self.stream,)).fetchone()
+        if row is None:
+            return False
+        if row[0] != self._generation:
+            self._reset()
+            self.events = 0
+            self._seq = 0
+            self._generation = row[0]
+        rows = conn.execute("SELECT seq, body FROM events WHERE stream = ? AND seq > ? ORDER BY seq",
+                            (self.stream, self._seq)).fetchall()
+        for seq, body in rows:
+            self._seq = seq
+            self.events += 1
+            self._apply(json.loads(body))
+        if rows:
+            self.version += 1
+        return bool(rows)
+
+    def _insert(self, conn, events):
+        conn.executemany("INSERT INTO events (stream, body) VALUES (?, ?)",
+                         [(self.stream, json.dumps(e, ensure_ascii=False, separators=(",", ":"))) for e in events])
+
+    @timed("store.log_append")
+    def append(self, events):
+        with self.backend.pool.transaction(self.durable) as conn:
+            self._insert(conn, events)
+
+    @timed("store.log_append")
+    def append_checked(self, make_events):
+        # same contract as EventLog.append_checked, inside one write transaction
+        with self.backend.pool.transaction(self.durable) as conn:
+            self._catch_up(conn)
+            events = list(make_events())
+            if events:
+                self._insert(conn, events)
+            return events
+
+    def create(self, make_events):
+        # first open: import the JSONL log if one exists, else the legacy seed
+        with self.backend.pool.transaction(durable=True) as conn:
+            if conn.execute("SELECT 1 FROM events WHERE stream = ? LIMIT 1", (self.stream,)).fetchone():
+                return
+            conn.execute("INSERT OR IGNORE INTO streams (stream, generation) VALUES (?, 0)", (self.stream,))
+            jsonl = os.path.join(self.backend.base_dir, self.stream + ".jsonl")
+            if os.path.exists(jsonl):
+                with open(jsonl, "rb") as f:
+                    events = [json.loads(line) for line in f if line.endswith(b"\n")]
+            else:
+                events = make_events()
+            self._insert(conn, events)
+
+    def rewrite(self, make_events):
+        # compaction: catch up and make_events() inside the write transaction,
+        # so nothing another process commits meanwhile can be dropped
+        with self.backend.pool.transaction(durable=True) as conn:
+            self._catch_up(conn)
+            events = list(make_events())
+            conn.execute("DELETE FROM events WHERE stream = ?", (self.stream,))
+            self._insert(conn, events)
+            conn.execute("UPDATE streams SET generation = generation + 1 WHERE stream = ?", (self.stream,))
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.paths = get_default_files(base_dir)
+        self.pool = ConnectionPool(self.paths["DATABASE"])
+        with self.pool.transaction() as conn:
+            for statement in _SQLITE_SCHEMA.strip().split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def event_log(self, stream, apply, reset, durable=False):
+        return SQLiteEventLog(self, stream, apply, reset, durable)
+
+_BACKENDS = {"json": JsonBackend, "sqlite": SQLiteBackend}
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(base_dir, kind=None):
+    kind = kind or os.environ.get("SWACHHMAP_STORAGE", "sqlite")
+    key = (os.path.abspath(base_dir), kind)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = _BACKENDS[kind](base_dir)
+        return _backends[key]
+
+class ReportStore:
+    COMPACT_MIN_EVENTS = 1000
+    FEED_SIZE = 5000
+
+    def __init__(self, base_dir):
+        paths = get_default_files(base_dir)
+        self.log_path = paths["REPORT_LOG"]
+        self.legacy_path = paths["REPORT_FILE"]
+        self.version = 0
+        self._lock = threading.RLock()
+        self._log = get_backend(base_dir).event_log("reports", self._apply, self._reset)
+        self._reset()
+        with self._lock:
+            self._log.create(self._legacy_events)
+            self._refresh()
+            if self._backfilled:
+                self.compact()
+
+    def _reset(self):
+        self._reports = []
+        self._by_id = {}
+        self._index = ReportIndex()
+        self._find_cache = {}
+        self._backfilled = 0
+        # recent deltas for sessions: (seq, "add" | "update", report_id, fields),
+        # fields being the names an update changed (None for an add)
+        self._feed = deque(maxlen=self.FEED_SIZE)
+        self._feed_epoch = getattr(self, "_feed_epoch", 0) + 1
+        self._seq = 0
+
+    def _legacy_events(self):
+        # one-off import of the old whole-file reports.json
+        legacy = load_json_file(self.legacy_path, [])
+        return [{"op": "add", "report": r} for r in legacy if isinstance(r, dict)]
+
+    def _refresh(self):
+        if self._log.refresh():
+            self.version += 1
+
+    def _apply(self, event):
+        op = event.get("op")
+        if op == "add" and isinstance(event.get("report"), dict):
+            report = event["report"]
+            if not report.get("id"):
+                report["id"] = legacy_report_id(report)
+                self._backfilled += 1
+            if report["id"] in self._by_id:
+                return
+            self._by_id[report["id"]] = len(self._reports)
+            self._index.add(len(self._reports), report)
+            self._reports.append(report)
+            self._seq += 1
+            self._feed.append((self._seq, "add", report["id"], None))
+        elif op in ("status", "update"):
+            i = self._by_id.get(event.get("id"))
+            if i is None:
+                return
+            fields = event.get("fields") if op == "update" else {"status": event.get("status")}
+            # replace rather than mutate so lists handed out by all() stay stable
+            self._index.remove(i, self._reports[i])
+            self._reports[i] = dict(self._reports[i], **(fields or {}))
+            self._index.add(i, self._reports[i])
+            self._seq += 1
+            self._feed.append((self._seq, "update", event.get("id"), tuple(fields or ())))
+
+    def _append_events(self, events):
+        self._log.append(events)
+        self._refresh()
+        if self._log.events > max(self.COMPACT_MIN_EVENTS, 2 * len(self._reports)):
+            self.compact()
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._reports)
+
+    def current_version(self):
+        with self._lock:
+            self._refresh()
+            return self.version
+
+    def snapshot(self):
+        # (version, reports); version changes whenever new events were read
+        with self._lock:
+            self._refresh()
+            return self.version, list(self._reports)
+
+    def cursor(self):
+        with self._lock:
+            self._refresh()
+            return (self._feed_epoch, self._seq)
+
+    def changes_since(self, cursor):
+        # (new_cursor, [(kind, report, fields)]) of deltas after `cursor`; the
+        # list is None when the cursor is too old (feed overflowed or log compacted)
+        with self._lock:
+            self._refresh()
+            new_cursor = (self._feed_epoch, self._seq)
+            epoch, seq = cursor or (None, 0)
+            if epoch != self._feed_epoch or (self._feed and self._feed[0][0] > seq + 1):
+                return new_cursor, None
+            deltas = [(kind, self._reports[self._by_id[rid]], fields) for s, kind, rid, fields in self._feed if s > seq]
+            return new_cursor, deltas
+
+    def since(self, start):
+        # reports are only ever appended, so callers can fold in just the tail
+        with self._lock:
+            self._refresh()
+            return self.version, self._reports[start:]
+
+    def count(self, status=None):
+        with self._lock:
+            self._refresh()
+            if status is None:
+                return len(self._reports)
+            return len(self._index.status.get(status, ()))
+
+    @timed("store.find")
+    def find(self, status=None, username=None, text=None, start=None, end=None):
+        # ascending store positions answered from the secondary indexes
+        with self._lock:
+            self._refresh()
+            key = (self.version, status, username, text, start, end)
+            if key not in self._find_cache:
+                if len(self._find_cache) > 64 or any(k[0] != self.version for k in self._find_cache):
+                    self._find_cache.clear()
+                self._find_cache[key] = self._index.find(status, username, text, start, end)
+            return self._find_cache[key]
+
+    @timed("store.page")
+    def page(self, cursor=None, limit=20, positions=None):
+        # Newest-first page starting at raw position `cursor` (None = newest),
+        # over every report or only `positions` from find(). Returns
+        # (reports, next_cursor); next_cursor is None once exhausted.
+        with self._lock:
+            self._refresh()
+            top = len(self._reports) - 1 if cursor is None else min(cursor, len(self._reports) - 1)
+            if positions is None:
+                picked = range(top, max(top - limit, -1), -1)
+                rest = top - limit
+            else:
+                end = bisect_right(positions, top)
+                picked = positions[max(end - limit, 0):end][::-1]
+                rest = positions[end - limit - 1] if end - limit > 0 else -1
+            return [self._reports[i] for i in picked], (rest if rest >= 0 else None)
+
+    def get(self, report_id):
+        with self._lock:
+            self._refresh()
+            i = self._by_id.get(report_id)
+            return None if i is None else self._reports[i]
+
+    def append(self, report):
+        with self._lock:
+            if not report.get("id"):
+                report["id"] = new_report_id()
+            self._append_events([{"op": "add", "report": report}])
+            return report["id"]
+
+    def append_many(self, reports):
+        # one log write (or one transaction) for the whole batch
+        with self._lock:
+            for report in reports:
+                if not report.get("id"):
+                    report["id"] = new_report_id()
+            if reports:
+                self._append_events([{"op": "add", "report": r} for r in reports])
+            return [r["id"] for r in reports]
+
+    def iter(self, chunk=1000):
+        # oldest-first, copying at most `chunk` references at a time
+        start = 0
+        while True:
+            with self._lock:
+                self._refresh()
+                batch = self._reports[start:start + chunk]
+            if not batch:
+                return
+            yield from batch
+            start += len(batch)
+
+    def update(self, report_id, **fields):
+        with self._lock:
+            self._refresh()
+            if report_id not in self._by_id:
+                return None
+            self._append_events([{"op": "update", "id": report_id, "fields": fields}])
+            return self.get(report_id)
+
+    def update_status(self, report_id, status):
+        if status == "Resolved":
+            return self.update(report_id, status=status, resolved_at=datetime.now().isoformat())
+        return self.update(report_id, status=status)
+
+    def compact(self):
+        with self._lock:
+            self._log.rewrite(lambda: ({"op": "add", "report": r} for r in self._reports))
+            self._refresh()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_report_store(base_dir):
+    key = os.path.abspath(base_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ReportStore(base_dir)
+        return _stores[key]
+
+def export_json(base_dir):
+    # writes the legacy whole-file JSON documents from the active backend
+    from auth import get_user_directory
+    from ledger import get_ledger
+    paths = get_default_files(base_dir)
+    save_json_file(paths["REPORT_FILE"], get_report_store(base_dir).all())
+    save_json_file(paths["USER_FILE"], get_user_directory(base_dir).all())
+    save_json_file(paths["TOKENS_FILE"], get_ledger(base_dir).balances())
+
+def import_json(base_dir):
+    # merges reports.json / users.json records the active backend does not have yet
+    from auth import get_user_directory
+    paths = get_default_files(base_dir)
+    store, directory = get_report_store(base_dir), get_user_directory(base_dir)
+    added = 0
+    for r in load_json_file(paths["REPORT_FILE"], []):
+        if isinstance(r, dict) and store.get(r.get("id") or legacy_report_id(r)) is None:
+            store.append(dict(r))
+            added += 1
+    users = 0
+    for username, entry in load_json_file(paths["USER_FILE"], {}).items():
+        if isinstance(entry, dict) and "password" not in entry:
+            continue  # hash scrubbed after the first import
+        users += directory.insert(username, entry)
+    return added, users
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Move data between the storage backend and the JSON files.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+    import data_store  # share one module instance with auth.py / ledger.py
+    if args.command == "export":
+        data_store.export_json(args.base_dir)
+        print("Exported reports.json, users.json and user_tokens.json.")
+    else:
+        reports, users = data_store.import_json(args.base_dir)
+        print(f"Imported {reports} report(s) and {users} user(s).")
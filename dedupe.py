@@ -0,0 +1,215 @@
+import io, math, os, re, threading
+from collections import deque
+from datetime import datetime, timedelta
+from data_store import get_report_store
+from geocode import normalize_location, parse_latlon
+from uploads import image_path
+from metrics import timed
+
+WINDOW_DAYS = 7
+RADIUS_M = 150
+IMAGE_DISTANCE = 6    # max differing bits between two 64-bit dHashes
+BANDS = 8             # 8 x 8-bit bands: any pair within 7 bits shares a band
+TEXT_SIMILARITY = 0.5
+CELL_DEG = 0.002      # ~220 m, so a 3x3 block covers RADIUS_M
+
+def image_hash(source):
+    # 64-bit difference hash of a path or file-like object; Pillow is only
+    # needed here, so it is imported on first use
+    from PIL import Image
+    with Image.open(source) as im:
+        px = list(im.convert("L").resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+def _bands(h):
+    return [(i, (h >> (8 * i)) & 0xFF) for i in range(BANDS)]
+
+def normalize_text(text):
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(text or "").lower()).split())
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def specific_place(location):
+    # typed coordinates or an address-like string (house/sector numbers, or
+    # three or more words); bare city or area names cover too much ground
+    place = normalize_location(location or "")
+    return bool(parse_latlon(place)) or any(c.isdigit() for c in place) or len(place.split()) >= 3
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    # equirectangular approximation, plenty at a few hundred metres
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+# Open reports from the last WINDOW_DAYS, indexed three ways: image hash bands
+# (LSH), a lat/lon grid and normalized location text. A new report is checked
+# against the union of candidates, and is a likely duplicate when at least two
+# of image, place and description agree. Place only counts for specific
+# locations: never for IP-detected (city-level) coordinates or bare city names.
+# Kept current from the store's change feed; entries leave the index when they
+# age out or get resolved.
+class DuplicateIndex:
+    def __init__(self, base_dir, window_days=WINDOW_DAYS):
+        self.base_dir = base_dir
+        self.window = timedelta(days=window_days)
+        self._lock = threading.Lock()
+        self._hashes = {}  # image name -> dHash (None when unreadable)
+        self._clear()
+
+    def _clear(self):
+        self.cursor = None
+        self._entries = {}
+        self._order = deque()
+        self._bands = {}
+        self._cells = {}
+        self._places = {}
+
+    def _image_hash(self, image):
+        if image not in self._hashes:
+            try:
+                self._hashes[image] = image_hash(image_path(self.base_dir, image))
+            except Exception:
+                self._hashes[image] = None
+        return self._hashes[image]
+
+    def _keys(self, entry):
+        keys = []
+        if entry["hash"] is not None:
+            keys += [(self._bands, band) for band in _bands(entry["hash"])]
+        if entry["lat"] is not None:
+            keys.append((self._cells, (int(entry["lat"] // CELL_DEG), int(entry["lon"] // CELL_DEG))))
+        if entry["place"]:
+            keys.append((self._places, entry["place"]))
+        return keys
+
+    def _entry(self, report):
+        lat, lon = report.get("lat"), report.get("lon")
+        precise = report.get("located_by") != "ip" and specific_place(report.get("location"))
+        if not precise:
+            lat = lon = None
+        text = normalize_text(report.get("description"))
+        return {
+            "id": report.get("id"),
+            "username": report.get("username"),
+            "timestamp": report.get("timestamp") or "",
+            "hash": self._image_hash(report["image"]) if report.get("image") else None,
+            "lat": None if lat is None else float(lat),
+            "lon": None if lon is None else float(lon),
+            "place": normalize_location(report.get("location") or "") if precise else "",
+            "trigrams": _trigrams(text) if text else set(),
+        }
+
+    def _remove(self, report_id):
+        entry = self._entries.pop(report_id, None)
+        if entry:
+            for table, key in self._keys(entry):
+                ids = table.get(key)
+                if ids:
+                    ids.discard(report_id)
+                    if not ids:
+                        del table[key]
+
+    def _put(self, report, cutoff):
+        report_id = report.get("id")
+        self._remove(report_id)
+        if not report_id or report.get("status") == "Resolved" or report.get("duplicate_of") \
+                or (report.get("timestamp") or "") < cutoff:
+            return
+        entry = self._entries[report_id] = self._entry(report)
+        self._order.append((entry["timestamp"], report_id))
+        for table, key in self._keys(entry):
+            table.setdefault(key, set()).add(report_id)
+
+    def sync(self, store):
+        cutoff = (datetime.now() - self.window).isoformat()
+        with self._lock:
+            cursor, deltas = store.changes_since(self.cursor)
+            if deltas is None:
+                self._clear()
+                cursor = store.cursor()
+                _, reports = store.snapshot()
+                positions = store.find(start=cutoff)
+                deltas = [("add", reports[pos], None) for pos in positions if pos < len(reports)]
+            for _kind, report, _fields in deltas:
+                self._put(report, cutoff)
+            self.cursor = cursor
+            while self._order and self._order[0][0] < cutoff:
+                _, report_id = self._order.popleft()
+                entry = self._entries.get(report_id)
+                if entry and entry["timestamp"] < cutoff:
+                    self._remove(report_id)
+
+    def remember(self, image, data):
+        # hash a fresh upload from memory so the feed never re-reads it from disk
+        try:
+            h = image_hash(io.BytesIO(data))
+        except Exception:
+            h = None
+        with self._lock:
+            self._hashes[image] = h
+
+    @timed("dedupe.match")
+    def match(self, report, limit=3):
+        # likely duplicates of `report`, best first: [{"id", "score", "reasons", "same_user"}]
+        with self._lock:
+            probe = self._entry(report)
+            candidates = set()
+            for table, key in self._keys(probe):
+                if table is self._cells:
+                    cy, cx = key
+                    for dy in (-1, 0, 1):
+                        for dx in (-1, 0, 1):
+                            candidates |= table.get((cy + dy, cx + dx), set())
+                else:
+                    candidates |= table.get(key, set())
+            matches = []
+            for report_id in candidates:
+                entry = self._entries[report_id]
+                reasons = []
+                if probe["hash"] is not None and entry["hash"] is not None \
+                        and bin(probe["hash"] ^ entry["hash"]).count("1") <= IMAGE_DISTANCE:
+                    reasons.append("image")
+                if probe["lat"] is not None and entry["lat"] is not None:
+                    if _distance_m(probe["lat"], probe["lon"], entry["lat"], entry["lon"]) <= RADIUS_M:
+                        reasons.append("place")
+                elif probe["place"] and probe["place"] == entry["place"]:
+                    reasons.append("place")
+                similarity = 0.0
+                if probe["trigrams"] and entry["trigrams"]:
+                    similarity = len(probe["trigrams"] & entry["trigrams"]) / len(probe["trigrams"] | entry["trigrams"])
+                    if similarity >= TEXT_SIMILARITY:
+                        reasons.append("description")
+                if len(reasons) >= 2:
+                    score = ("image" in reasons) + ("place" in reasons) + similarity
+                    matches.append({"id": report_id, "score": round(score, 3), "reasons": reasons,
+                                    "same_user": entry["username"] == probe["username"]})
+            matches.sort(key=lambda m: -m["score"])
+            return matches[:limit]
+
+    def duplicate_of(self, report):
+        # id of the report `report` repeats, or None. Only a resubmission by the
+        # same user, or the same photo from anyone, counts; two citizens
+        # describing the same spot in their own words are both kept.
+        for match in self.match(report):
+            if match["same_user"] or "image" in match["reasons"]:
+                return match["id"]
+        return None
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_duplicate_index(base_dir):
+    store = get_report_store(base_dir)
+    key = os.path.abspath(base_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = DuplicateIndex(base_dir)
+    index.sync(store)
+    return index
@@ -0,0 +1,238 @@
+import os, queue, re, threading, time
+from collections import OrderedDict
+from data_store import get_default_files, load_json_file, save_json_atomic, get_report_store
+from metrics import timed, span, incr
+
+_LATLON_RE = re.compile(r'(-?\d{1,3}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)')
+
+def nominatim_geocoder(location_name):
+    # imported lazily so pages without a map never pay for geopy
+    from geopy.geocoders import Nominatim
+    location = Nominatim(user_agent='swacchmap_app').geocode(location_name, timeout=10)
+    if location:
+        return {'lat': location.latitude, 'lon': location.longitude}
+    return None
+
+def parse_latlon(text):
+    # "22.57,88.36" as returned by ipinfo, or a location string that embeds it
+    match = _LATLON_RE.search(text or '')
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return {'lat': lat, 'lon': lon}
+    return None
+
+def normalize_location(location_name):
+    return " ".join(str(location_name).lower().split())
+
+# Persistent location -> coordinates cache. Misses go to one worker thread so
+# the provider never sees more than one request per `min_interval` seconds.
+class GeoCache:
+    def __init__(self, path, geocoder=None, max_entries=20000, max_age=30 * 86400,
+                 min_interval=1.0, negative_age=86400):
+        self.path = path
+        self.geocoder = geocoder or nominatim_geocoder
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.negative_age = negative_age
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._queue = queue.Queue()
+        self._inflight = set()
+        self._callbacks = {}
+        self._dirty = False
+        self._worker = None
+        self._last_call = 0.0
+        raw = load_json_file(path, {}) if path else {}
+        entries = sorted((v.get('ts', 0), k, v) for k, v in raw.items() if isinstance(v, dict))
+        self._entries = OrderedDict((k, v) for _, k, v in entries)
+        with self._lock:
+            self._evict()
+
+    def _fresh(self, entry, now):
+        age = self.max_age if entry.get('lat') is not None else self.negative_age
+        return now - entry.get('ts', 0) <= age
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, v in self._entries.items() if not self._fresh(v, now)]:
+            del self._entries[key]
+            self._dirty = True
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._dirty = True
+
+    def _cached(self, key):
+        # (hit, coords); a hit with coords None is a remembered "not found"
+        entry = self._entries.get(key)
+        if entry is None or not self._fresh(entry, time.time()):
+            incr("geocode.cache_miss")
+            return False, None
+        incr("geocode.cache_hit")
+        self._entries.move_to_end(key)
+        if entry.get('lat') is None:
+            return True, None
+        return True, {'lat': entry['lat'], 'lon': entry['lon']}
+
+    def get(self, location_name):
+        with self._lock:
+            return self._cached(normalize_location(location_name))[1]
+
+    def cached(self, location_name):
+        # (hit, coords); hit is False when not even a negative result is cached
+        with self._lock:
+            return self._cached(normalize_location(location_name))
+
+    def _enqueue(self, key, location_name):
+        if key in self._inflight:
+            return
+        self._inflight.add(key)
+        self._queue.put((key, location_name))
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='geocode-worker', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                key, location_name = self._queue.get(timeout=5)
+            except queue.Empty:
+                # decide to exit under the lock _enqueue() runs under, so a miss
+                # queued after the last get() always finds a live worker
+                with self._lock:
+                    idle = self._queue.empty()
+                    if idle:
+                        self._worker = None
+                if idle:
+                    self.flush()
+                    return
+                continue
+            wait = self._last_call + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_call = time.monotonic()
+            try:
+                with span("geocode.provider"):
+                    coords = self.geocoder(location_name)
+                failed = False
+            except Exception:
+                coords, failed = None, True
+            with self._lock:
+                self._inflight.discard(key)
+                callbacks = list(self._callbacks.pop(key, {}).values())
+                if not failed:
+                    entry = {'lat': None, 'lon': None, 'ts': time.time()}
+                    if coords:
+                        entry.update(lat=coords['lat'], lon=coords['lon'])
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    self._dirty = True
+                    self._evict()
+                self._done.notify_all()
+            for callback in callbacks:
+                try:
+                    callback(coords)
+                except Exception:
+                    pass
+            if self._queue.empty():
+                self.flush()
+
+    @timed("geocode.resolve_many")
+    def resolve_many(self, location_names, wait=0):
+        # Deduplicates names, queues misses, and waits up to `wait` seconds
+        # for them. Returns {location_name: coords} for everything resolved.
+        keys = {}
+        for name in location_names:
+            if name:
+                keys.setdefault(normalize_location(name), name)
+        deadline = time.monotonic() + wait
+        with self._lock:
+            first = True
+            while True:
+                found, missing = {}, []
+                for key, name in keys.items():
+                    hit, coords = self._cached(key)
+                    if coords:
+                        found[key] = coords
+                    elif not hit:
+                        missing.append((key, name))
+                if first:
+                    for key, name in missing:
+                        self._enqueue(key, name)
+                    first = False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not any(key in self._inflight for key, _ in missing):
+                    break
+                self._done.wait(remaining)
+        return {name: found[normalize_location(name)]
+                for name in location_names if name and normalize_location(name) in found}
+
+    def resolve_async(self, location_name, callback, tag=None):
+        # callback(coords or None) runs on the worker thread once resolved;
+        # `tag` lets repeated requests for the same caller collapse into one
+        key = normalize_location(location_name)
+        with self._lock:
+            hit, coords = self._cached(key)
+            if not hit:
+                self._callbacks.setdefault(key, {})[tag if tag is not None else id(callback)] = callback
+                self._enqueue(key, location_name)
+                return True
+        callback(coords)
+        return False
+
+    def lookup(self, location_name, wait=15):
+        return self.resolve_many([location_name], wait=wait).get(location_name)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty or not self.path:
+                    return
+                data = dict(self._entries)
+                self._dirty = False
+            save_json_atomic(self.path, data)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_geocache(base_dir, geocoder=None):
+    key = os.path.abspath(base_dir)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = GeoCache(get_default_files(base_dir)['GEOCACHE_FILE'], geocoder=geocoder)
+        return _caches[key]
+
+def geocode_report_async(base_dir, report):
+    # fills lat/lon on a stored report in the background; True while pending
+    store = get_report_store(base_dir)
+    report_id = report.get('id')
+    def _store(coords):
+        if coords:
+            store.update(report_id, lat=coords['lat'], lon=coords['lon'])
+    return get_geocache(base_dir).resolve_async(report.get('location'), _store, tag=report_id)
+
+def backfill_report_coords(base_dir, geocoder=None):
+    store = get_report_store(base_dir)
+    geocache = get_geocache(base_dir, geocoder=geocoder)
+    missing = [r for r in store.all() if r.get('lat') is None and r.get('location')]
+    names = [r['location'] for r in missing if not parse_latlon(r['location'])]
+    coords = geocache.resolve_many(names, wait=geocache.min_interval * (len(set(names)) + 1) + 30)
+    updated = 0
+    for report in missing:
+        loc = parse_latlon(report['location']) or coords.get(report['location'])
+        if loc:
+            store.update(report['id'], lat=loc['lat'], lon=loc['lon'])
+            updated += 1
+    geocache.flush()
+    return updated, len(missing)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Store lat/lon on reports that do not have them yet.')
+    parser.add_argument('--base-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+    updated, missing = backfill_report_coords(args.base_dir)
+    print(f'Located {updated} of {missing} reports without coordinates.')
@@ -0,0 +1,213 @@
+import os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from data_store import get_backend, get_report_store
+from geocode import get_geocache
+from ledger import get_ledger
+from uploads import make_thumbnail, thumb_path
+from aggregates import get_aggregates
+
+HANDLERS = {}
+LANES = {}
+# slow or rate-limited kinds get their own lane so they never hold up credits
+LANE_WORKERS = {"geocode": 1}
+
+def job_handler(kind, lane="default"):
+    def register(fn):
+        HANDLERS[kind] = fn
+        LANES[kind] = lane
+        return fn
+    return register
+
+@job_handler("credit")
+def _credit(base_dir, payload):
+    get_ledger(base_dir).credit_many([tuple(e) for e in payload["entries"]], key=payload.get("key"))
+
+@job_handler("geocode", lane="geocode")
+def _geocode(base_dir, payload):
+    geocache = get_geocache(base_dir)
+    coords = geocache.lookup(payload["location"], wait=120)
+    if coords:
+        get_report_store(base_dir).update(payload["report_id"], lat=coords["lat"], lon=coords["lon"])
+    elif not geocache.cached(payload["location"])[0]:
+        # neither found nor a cached "no such place": the provider failed or
+        # timed out, so let the queue retry with backoff
+        raise RuntimeError(f"geocoding {payload['location']!r} failed")
+
+@job_handler("thumbnail")
+def _thumbnail(base_dir, payload):
+    if not os.path.exists(thumb_path(base_dir, payload["image"])):
+        make_thumbnail(base_dir, payload["image"])
+
+@job_handler("refresh_aggregates")
+def _refresh_aggregates(base_dir, payload):
+    get_aggregates(base_dir)
+
+# Durable background jobs kept as a "jobs" event stream on the active backend
+# (jobs.jsonl or the SQLite events table). Pending jobs survive restarts and
+# are picked up again by the dispatcher (started with the app); failures retry
+# with backoff. Every process follows the same stream, so a process first logs
+# a "claim" with a lease, under the log's lock, and only claimed jobs run; a
+# crashed owner's jobs become claimable again once their lease runs out.
+class JobQueue:
+    MAX_ATTEMPTS = 5
+    COMPACT_MIN_EVENTS = 1000
+    KEY_TTL = 7 * 86400  # how long an idempotency key blocks a repeat enqueue
+    LEASE = 300          # seconds a claim holds a job (geocode waits up to 120)
+    RETRY_DELAY = 1.0    # retry n waits RETRY_DELAY * 2**n seconds
+
+    def __init__(self, base_dir, workers=2, start=True):
+        self.base_dir = base_dir
+        self.workers = workers
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        self._log = get_backend(base_dir).event_log("jobs", self._apply, self._reset, durable=True)
+        self._reset()
+        self._running = set()
+        self._pools = {}
+        with self._lock:
+            self._log.create(list)
+            self._log.refresh()
+        if start:
+            threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True).start()
+
+    def _reset(self):
+        self._pending = {}
+        self._keys = {}  # idempotency key -> time first seen, oldest first
+
+    def _apply(self, event):
+        op, job_id, key = event.get("op"), event.get("id"), event.get("key")
+        if op == "enqueue" and key and key in self._keys and job_id not in self._pending:
+            return  # another process enqueued this key first
+        if key:
+            self._keys.setdefault(key, event.get("ts") or time.time())
+        if op == "enqueue":
+            # compaction re-emits pending jobs with their retry and lease state
+            self._pending[job_id] = {k: event.get(k) for k in ("id", "kind", "payload", "key", "ts", "owner")}
+            self._pending[job_id].update(attempts=event.get("attempts", 0), run_after=event.get("run_after", 0),
+                                         lease_until=event.get("lease_until", 0))
+        elif op == "claim" and job_id in self._pending:
+            self._pending[job_id].update(owner=event["owner"], lease_until=event["until"])
+        elif op == "retry" and job_id in self._pending:
+            self._pending[job_id].update(attempts=event["attempts"], run_after=event["run_after"],
+                                         owner=None, lease_until=0)
+        elif op in ("done", "failed"):
+            self._pending.pop(job_id, None)
+
+    def _expire_keys(self):
+        cutoff = time.time() - self.KEY_TTL
+        while self._keys:
+            key, ts = next(iter(self._keys.items()))
+            if ts >= cutoff:
+                break
+            del self._keys[key]
+
+    def _compact_events(self):
+        pending_keys = {job["key"] for job in self._pending.values() if job.get("key")}
+        return ([{"op": "key", "key": k, "ts": ts} for k, ts in self._keys.items() if k not in pending_keys]
+                + [{"op": "enqueue", **job} for job in self._pending.values()])
+
+    def _record(self, events):
+        with self._lock:
+            self._log.append(events)
+            self._written()
+
+    def _written(self):
+        self._log.refresh()
+        self._expire_keys()
+        # keys expire, so the log stays around twice the live keys and jobs
+        if self._log.events > max(self.COMPACT_MIN_EVENTS, 2 * (len(self._pending) + len(self._keys))):
+            self._log.rewrite(self._compact_events)
+            self._log.refresh()
+        self._wake.notify_all()
+
+    def enqueue(self, kind, payload, key=None):
+        # returns False when a job with the same idempotency key already exists
+        return self.enqueue_many([(kind, payload, key)]) == 1
+
+    def enqueue_many(self, jobs):
+        # [(kind, payload, key)] in one durable write; returns how many were new.
+        # Keys are checked under the log's lock, so racing processes cannot
+        # both enqueue one key.
+        def events():
+            new, keys = [], set()
+            for kind, payload, key in jobs:
+                if key and (key in self._keys or key in keys):
+                    continue
+                keys.add(key)
+                new.append({"op": "enqueue", "id": uuid.uuid4().hex, "kind": kind, "payload": payload,
+                            "key": key, "ts": time.time()})
+            return new
+        with self._lock:
+            written = self._log.append_checked(events)
+            if written:
+                self._written()
+            return len(written)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stop(self):
+        # lets the dispatcher exit and waits for running jobs (tests, shutdown)
+        self._stopped.set()
+        with self._lock:
+            self._wake.notify_all()
+        for pool in list(self._pools.values()):
+            pool.shutdown(wait=True)
+
+    def _claimable(self, job, now):
+        return job["run_after"] <= now and job.get("lease_until", 0) <= now and job["id"] not in self._running
+
+    def _dispatch(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                self._log.refresh()
+                now = time.time()
+                claimed = []
+                if any(self._claimable(j, now) for j in self._pending.values()):
+                    claimed = self._log.append_checked(lambda: [
+                        {"op": "claim", "id": j["id"], "owner": self.owner, "until": now + self.LEASE}
+                        for j in self._pending.values() if self._claimable(j, now)])
+                    self._log.refresh()
+                for event in claimed:
+                    job = self._pending.get(event["id"])
+                    if job is not None and job.get("owner") == self.owner:
+                        self._running.add(job["id"])
+                        self._lane(LANES.get(job["kind"], "default")).submit(self._run, dict(job))
+                if not claimed:
+                    waiting = [max(j["run_after"], j.get("lease_until", 0)) for j in self._pending.values()
+                               if j["id"] not in self._running]
+                    self._wake.wait(min([1.0] + [max(0.01, t - now) for t in waiting]))
+
+    def _lane(self, lane):
+        if lane not in self._pools:
+            self._pools[lane] = ThreadPoolExecutor(max_workers=LANE_WORKERS.get(lane, self.workers),
+                                                   thread_name_prefix=f"job-{lane}")
+        return self._pools[lane]
+
+    def _run(self, job):
+        try:
+            HANDLERS[job["kind"]](self.base_dir, job["payload"])
+            event = {"op": "done", "id": job["id"]}
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            if attempts >= self.MAX_ATTEMPTS or job["kind"] not in HANDLERS:
+                event = {"op": "failed", "id": job["id"], "error": repr(e)}
+            else:
+                event = {"op": "retry", "id": job["id"], "attempts": attempts,
+                         "run_after": time.time() + self.RETRY_DELAY * 2 ** attempts, "error": repr(e)}
+        self._record([event])
+        with self._lock:
+            self._running.discard(job["id"])
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+def get_job_queue(base_dir):
+    key = os.path.abspath(base_dir)
+    with _queues_lock:
+        if key not in _queues:
+            _queues[key] = JobQueue(base_dir)
+        return _queues[key]
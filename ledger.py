@@ -0,0 +1,116 @@
+import os, threading, time
+from data_store import get_backend, get_default_files, load_json_file, save_json_atomic, file_lock
+from metrics import timed
+
+# Token balances are derived from an append-only transaction log
+# (token_ledger.jsonl); user_tokens.json is only a periodic snapshot of them.
+class TokenLedger:
+    SNAPSHOT_EVERY = 50
+    COMPACT_MIN_EVENTS = 5000
+
+    def __init__(self, base_dir):
+        paths = get_default_files(base_dir)
+        self.snapshot_path = paths["TOKENS_FILE"]
+        self.users_path = paths["USER_FILE"]
+        self._lock = threading.RLock()
+        self._log = get_backend(base_dir).event_log("token_ledger", self._apply, self._reset, durable=True)
+        self._since_snapshot = 0
+        self._reset()
+        with self._lock:
+            self._log.create(self._opening_events)
+            self._log.refresh()
+
+    def current_version(self):
+        with self._lock:
+            self._log.refresh()
+            return self._log.version
+
+    def _reset(self):
+        self._balances = {}
+        self._keys = set()
+
+    def _opening_events(self):
+        # seed from the old user_tokens.json, falling back to users.json balances
+        balances = dict(load_json_file(self.snapshot_path, {}))
+        for user, entry in load_json_file(self.users_path, {}).items():
+            if user not in balances and isinstance(entry, dict):
+                balances[user] = entry.get("tokens", 0)
+        entries = [[user, amount, "opening balance"] for user, amount in balances.items()]
+        return [{"op": "credit", "entries": entries, "ts": time.time()}] if entries else []
+
+    def _apply(self, event):
+        if event.get("op") != "credit":
+            return
+        if event.get("key"):
+            # a key that already paid out never counts twice, even if two
+            # writers managed to log it
+            if event["key"] in self._keys:
+                return
+            self._keys.add(event["key"])
+        for user, amount, _reason in event.get("entries", []):
+            self._balances[user] = self._balances.get(user, 0) + amount
+
+    def balance(self, username):
+        with self._lock:
+            self._log.refresh()
+            return self._balances.get(username, 0)
+
+    def balances(self):
+        with self._lock:
+            self._log.refresh()
+            return dict(self._balances)
+
+    def credit(self, username, amount, reason, key=None):
+        return self.credit_many([(username, amount, reason)], key=key)
+
+    @timed("tokens.credit")
+    def credit_many(self, entries, key=None):
+        # All entries land in one log line (one fsync'd write). A repeated
+        # `key` is ignored, so retried jobs never pay out twice.
+        entries = [[u, amount, reason] for u, amount, reason in entries if u]
+        if not entries:
+            return False
+        event = {"op": "credit", "entries": entries, "ts": time.time()}
+        if key:
+            event["key"] = key
+        with self._lock:
+            # the key check runs under the log's lock / write transaction
+            if not self._log.append_checked(lambda: [] if key and key in self._keys else [event]):
+                return False
+            self._log.refresh()
+            self._since_snapshot += 1
+            if self._log.events > max(self.COMPACT_MIN_EVENTS, 2 * (len(self._keys) + 1)):
+                self.compact()
+            elif self._since_snapshot >= self.SNAPSHOT_EVERY:
+                self.snapshot()
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            self._since_snapshot = 0
+            balances = self.balances()
+            # other processes snapshot through the same .tmp path
+            with file_lock(self.snapshot_path):
+                save_json_atomic(self.snapshot_path, balances)
+
+    def compact(self):
+        # one opening line per user plus the idempotency keys seen so far
+        with self._lock:
+            def events():
+                entries = [[u, b, "opening balance"] for u, b in self._balances.items()]
+                yield {"op": "credit", "entries": entries, "ts": time.time()}
+                for key in self._keys:
+                    yield {"op": "credit", "entries": [], "key": key}
+            self._log.rewrite(events)
+            self._log.refresh()
+            self.snapshot()
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+def get_ledger(base_dir):
+    key = os.path.abspath(base_dir)
+    with _ledgers_lock:
+        if key not in _ledgers:
+            _ledgers[key] = TokenLedger(base_dir)
+        return _ledgers[key]
@@ -0,0 +1,65 @@
+import ipaddress, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from geocode import parse_latlon
+
+def ipinfo_provider(ip=None, timeout=3.0):
+    # imported lazily so pages that never detect a location skip requests
+    import requests
+    if ip and not ipaddress.ip_address(ip).is_global:
+        ip = None  # local/private client: fall back to the server's own address
+    url = f"https://ipinfo.io/{ip}/json" if ip else "https://ipinfo.io/json"
+    resp = requests.get(url, timeout=timeout)
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+    coords = parse_latlon(data.get("loc", "")) or {}
+    return {
+        "label": ", ".join(p for p in (data.get("city", ""), data.get("region", ""), data.get("country", "")) if p),
+        "lat": coords.get("lat"),
+        "lon": coords.get("lon"),
+    }
+
+# IP-based location lookups off the script thread, with a strict timeout and a
+# per-client TTL cache. `provider(ip, timeout)` returns {label, lat, lon} or None.
+class LocationService:
+    def __init__(self, provider=None, timeout=3.0, ttl=3600, workers=4):
+        self.provider = provider or ipinfo_provider
+        self.timeout = timeout
+        self.ttl = ttl
+        self._cache = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="locate")
+
+    def detect(self, client_key, ip=None):
+        # returns a Future resolving to {label, lat, lon} or None
+        with self._lock:
+            hit = self._cache.get(client_key)
+            if hit and hit[0] > time.monotonic():
+                done = Future()
+                done.set_result(hit[1])
+                return done
+            if client_key not in self._inflight:
+                self._inflight[client_key] = self._pool.submit(self._lookup, client_key, ip)
+            return self._inflight[client_key]
+
+    def _lookup(self, client_key, ip):
+        try:
+            result = self.provider(ip, timeout=self.timeout)
+        except Exception:
+            result = None
+        with self._lock:
+            self._inflight.pop(client_key, None)
+            if result:
+                self._cache[client_key] = (time.monotonic() + self.ttl, result)
+        return result
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_location_service(provider=None):
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = LocationService(provider)
+        return _service
@@ -0,0 +1,71 @@
+import threading
+import numpy as np
+import pandas as pd
+from data_store import get_report_store
+
+STATUSES = ['Pending', 'In Progress', 'Resolved']
+# web-map zoom levels to precompute; a grid cell at zoom z is 360 / 2**z degrees wide
+ZOOM_LEVELS = (2, 4, 6, 8, 10, 12, 14, 16)
+MAX_CLUSTERS = 1500
+
+def build_frame(reports):
+    rows = [(r.get('lat'), r.get('lon'), r.get('status') or 'Pending')
+            for r in reports if r.get('lat') is not None and r.get('lon') is not None]
+    frame = pd.DataFrame.from_records(rows, columns=['lat', 'lon', 'status'])
+    frame[['lat', 'lon']] = frame[['lat', 'lon']].astype(float)
+    return frame
+
+def cluster_frame(frame, zoom):
+    columns = ['lat', 'lon', 'count'] + STATUSES
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+    size = 360.0 / (2 ** zoom)
+    cells = frame.assign(
+        cx=np.floor((frame['lon'].to_numpy() + 180.0) / size).astype(np.int64),
+        cy=np.floor((frame['lat'].to_numpy() + 90.0) / size).astype(np.int64),
+    )
+    grouped = cells.groupby(['cx', 'cy'])
+    clusters = grouped.agg(lat=('lat', 'mean'), lon=('lon', 'mean'), count=('lat', 'size'))
+    by_status = cells.groupby(['cx', 'cy', 'status']).size().unstack(fill_value=0)
+    by_status = by_status.reindex(columns=STATUSES, fill_value=0)
+    return clusters.join(by_status).reset_index(drop=True)[columns]
+
+# Columnar lat/lon/status frame plus per-zoom clusters for one store version.
+class MapIndex:
+    def __init__(self, version, reports):
+        self.version = version
+        self.frame = build_frame(reports)
+        self.unlocated = [r for r in reports if r.get('lat') is None and r.get('location')]
+        self.clusters = {z: cluster_frame(self.frame, z) for z in ZOOM_LEVELS}
+
+    def bounds(self):
+        if self.frame.empty:
+            return None
+        return (self.frame['lat'].min(), self.frame['lon'].min(),
+                self.frame['lat'].max(), self.frame['lon'].max())
+
+    def visible(self, bounds, zoom, max_clusters=MAX_CLUSTERS):
+        # bounds is (south, west, north, east); None means everything.
+        # Falls back to coarser levels until the payload fits max_clusters.
+        levels = [z for z in ZOOM_LEVELS if z <= zoom] or [ZOOM_LEVELS[0]]
+        for level in reversed(levels):
+            clusters = self.clusters[level]
+            if bounds is not None:
+                south, west, north, east = bounds
+                lat, lon = clusters['lat'].to_numpy(), clusters['lon'].to_numpy()
+                inside = (lat >= south) & (lat <= north)
+                inside &= (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+                clusters = clusters[inside]
+            if len(clusters) <= max_clusters or level == levels[0]:
+                return clusters.head(max_clusters)
+
+_index = {}
+_index_lock = threading.Lock()
+
+def get_map_index(base_dir):
+    store = get_report_store(base_dir)
+    with _index_lock:
+        index = _index.get(store.log_path)
+        if index is None or index.version != store.current_version():
+            index = _index[store.log_path] = MapIndex(*store.snapshot())
+        return index
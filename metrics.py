@@ -0,0 +1,146 @@
+import json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Lightweight timing spans and counters. Everything is a no-op (one global
+# check) unless SWACHHMAP_METRICS=1 or enable() was called.
+_enabled = os.environ.get("SWACHHMAP_METRICS", "") not in ("", "0")
+WINDOW = 1000
+_lock = threading.Lock()
+_samples = {}
+_totals = {}
+_counters = {}
+_local = threading.local()
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+def enabled():
+    return _enabled
+
+def record(name, ms):
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=WINDOW)
+        samples.append(ms)
+        count, total = _totals.get(name, (0, 0.0))
+        _totals[name] = (count + 1, total + ms)
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        count, total = rerun.get(name, (0, 0.0))
+        rerun[name] = (count + 1, total + ms)
+
+@contextmanager
+def span(name):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+def timed(name):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorate
+
+def incr(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+# Streamlit runs each session's script on its own thread, so a thread-local
+# collector gives the breakdown of the current rerun.
+def begin_rerun():
+    _local.rerun = {} if _enabled else None
+    _local.rerun_start = time.perf_counter()
+
+def rerun_breakdown():
+    # {name: (count, total_ms)} for the current rerun, plus its elapsed time
+    rerun = getattr(_local, "rerun", None) or {}
+    start = getattr(_local, "rerun_start", None)
+    elapsed = None if start is None else (time.perf_counter() - start) * 1000
+    return dict(rerun), elapsed
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+def snapshot():
+    with _lock:
+        timings = {}
+        for name, samples in _samples.items():
+            ordered = sorted(samples)
+            count, total = _totals[name]
+            timings[name] = {"count": count, "total_ms": round(total, 3),
+                             "p50_ms": round(_percentile(ordered, 0.5), 3),
+                             "p95_ms": round(_percentile(ordered, 0.95), 3),
+                             "p99_ms": round(_percentile(ordered, 0.99), 3)}
+        return {"timings": timings, "counters": dict(_counters)}
+
+def render_prometheus():
+    snap = snapshot()
+    metric = lambda name: "swachhmap_" + "".join(c if c.isalnum() else "_" for c in name)
+    lines = ["# TYPE swachhmap_span_ms summary"]
+    for name, t in sorted(snap["timings"].items()):
+        for q, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+            lines.append(f'swachhmap_span_ms{{span="{name}",quantile="{q}"}} {t[key]}')
+        lines.append(f'swachhmap_span_ms_sum{{span="{name}"}} {t["total_ms"]}')
+        lines.append(f'swachhmap_span_ms_count{{span="{name}"}} {t["count"]}')
+    for name, value in sorted(snap["counters"].items()):
+        lines.append(f"# TYPE {metric(name)}_total counter")
+        lines.append(f"{metric(name)}_total {value}")
+    return "\n".join(lines) + "\n"
+
+def serve(port=9464, host="127.0.0.1"):
+    # /metrics (Prometheus text) and /metrics.json on a daemon thread
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, kind = json.dumps(snapshot()).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, kind = render_prometheus().encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_from_env():
+    # started once per process when SWACHHMAP_METRICS_PORT is set
+    global _server
+    port = os.environ.get("SWACHHMAP_METRICS_PORT")
+    with _server_lock:
+        if port and _server is None:
+            try:
+                _server = serve(int(port))
+            except OSError:
+                _server = False
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right, insort
+
+def _grams(text, n=3):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+# Substring index over one text field. Postings go from distinct lowercased
+# values to report positions, and trigrams point at distinct values, so
+# repeated values like "Kolkata" are only indexed once.
+class TextIndex:
+    def __init__(self):
+        self.values = {}
+        self.trigrams = {}
+
+    def add(self, text, pos):
+        postings = self.values.get(text)
+        if postings is None:
+            postings = self.values[text] = set()
+            for gram in _grams(text):
+                self.trigrams.setdefault(gram, set()).add(text)
+        postings.add(pos)
+
+    def remove(self, text, pos):
+        postings = self.values.get(text)
+        if postings is None:
+            return
+        postings.discard(pos)
+        if not postings:
+            del self.values[text]
+            for gram in _grams(text):
+                self.trigrams[gram].discard(text)
+                if not self.trigrams[gram]:
+                    del self.trigrams[gram]
+
+    def search(self, q):
+        if len(q) < 3:
+            candidates = self.values
+        else:
+            gram_sets = sorted((self.trigrams.get(g, set()) for g in _grams(q)), key=len)
+            candidates = set.intersection(*gram_sets)
+        hits = set()
+        for text in candidates:
+            if q in text:
+                hits |= self.values[text]
+        return hits
+
+# Secondary indexes over report positions in the store: status, username,
+# timestamp order and substring search over location and username.
+class ReportIndex:
+    def __init__(self):
+        self.status = {}
+        self.username = {}
+        self.location_text = TextIndex()
+        self.username_text = TextIndex()
+        self._ts = []
+
+    @staticmethod
+    def _keys(report):
+        return (report.get("status", "Pending"), report.get("username", ""),
+                (report.get("location") or "").lower(), (report.get("username") or "").lower(),
+                report.get("timestamp") or "")
+
+    def add(self, pos, report):
+        status, user, location, user_text, ts = self._keys(report)
+        self.status.setdefault(status, set()).add(pos)
+        self.username.setdefault(user, set()).add(pos)
+        self.location_text.add(location, pos)
+        self.username_text.add(user_text, pos)
+        if not self._ts or self._ts[-1] <= (ts, pos):
+            self._ts.append((ts, pos))
+        else:
+            insort(self._ts, (ts, pos))
+
+    def remove(self, pos, report):
+        status, user, location, user_text, ts = self._keys(report)
+        self.status.get(status, set()).discard(pos)
+        self.username.get(user, set()).discard(pos)
+        self.location_text.remove(location, pos)
+        self.username_text.remove(user_text, pos)
+        i = bisect_left(self._ts, (ts, pos))
+        if i < len(self._ts) and self._ts[i] == (ts, pos):
+            del self._ts[i]
+
+    def between(self, start=None, end=None):
+        # ISO timestamps sort lexicographically; `end` is inclusive by prefix,
+        # so end="2025-09-14" covers the whole day
+        lo = 0 if start is None else bisect_left(self._ts, (start,))
+        hi = len(self._ts) if end is None else bisect_right(self._ts, (end + "\uffff",))
+        return {pos for _, pos in self._ts[lo:hi]}
+
+    def find(self, status=None, username=None, text=None, start=None, end=None):
+        # Returns ascending positions matching every given filter, or None when
+        # no filter was given. `text` matches location or username substrings.
+        sets = []
+        if status is not None:
+            sets.append(self.status.get(status, set()))
+        if username is not None:
+            sets.append(self.username.get(username, set()))
+        if text:
+            q = text.lower()
+            sets.append(self.location_text.search(q) | self.username_text.search(q))
+        if start is not None or end is not None:
+            sets.append(self.between(start, end))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sorted(sets[0].intersection(*sets[1:]))
@@ -0,0 +1,159 @@
+import argparse, csv, io, json, os, sys, time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from data_store import get_report_store, legacy_report_id
+
+CSV_FIELDS = ["id", "username", "location", "description", "image", "timestamp", "status", "lat", "lon",
+              "located_by", "resolved_at", "duplicate_of"]
+STATUSES = {"Pending", "In Progress", "Resolved"}
+
+def report_key(report):
+    return report.get("id") or legacy_report_id(report)
+
+def validate(report):
+    # returns the cleaned report, or None if it cannot be imported
+    if not isinstance(report, dict):
+        return None
+    report = {k: v for k, v in report.items() if v not in ("", None)}
+    if not report.get("username") or not report.get("location") or "description" not in report:
+        return None
+    try:
+        datetime.fromisoformat(report.get("timestamp", ""))
+    except (TypeError, ValueError):
+        return None
+    report.setdefault("status", "Pending")
+    if report["status"] not in STATUSES:
+        return None
+    for field in ("lat", "lon"):
+        if field in report:
+            try:
+                report[field] = float(report[field])
+            except (TypeError, ValueError):
+                return None
+    report.setdefault("image", None)
+    return report
+
+def parse_chunk(lines, fmt, header=None):
+    # runs in worker processes too, so it only takes and returns plain data
+    if fmt == "csv":
+        rows = csv.DictReader(io.StringIO("".join(lines)), fieldnames=header)
+    else:
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+    return [validate(r) for r in rows]
+
+def read_chunks(f, fmt, chunk_size):
+    header = next(csv.reader([f.readline()])) if fmt == "csv" else None
+    while True:
+        lines = list(islice(f, chunk_size))
+        if not lines:
+            return
+        if fmt == "csv":
+            # keep quoted multi-line fields together
+            while lines[-1:] and "".join(lines).count('"') % 2:
+                extra = f.readline()
+                if not extra:
+                    break
+                lines.append(extra)
+        else:
+            lines = [l for l in lines if l.strip()]
+        yield lines, header
+
+def parsed_batches(f, fmt, chunk_size, workers):
+    chunks = read_chunks(f, fmt, chunk_size)
+    if workers <= 1:
+        for lines, header in chunks:
+            yield parse_chunk(lines, fmt, header)
+        return
+    from multiprocessing import Pool
+    with Pool(workers) as pool:
+        # at most 2 chunks per worker in flight keeps memory bounded
+        window = deque()
+        for lines, header in chunks:
+            window.append(pool.apply_async(parse_chunk, (lines, fmt, header)))
+            if len(window) >= 2 * workers:
+                yield window.popleft().get()
+        while window:
+            yield window.popleft().get()
+
+def import_reports(base_dir, f, fmt, batch_size=5000, workers=0):
+    store = get_report_store(base_dir)
+    seen = {r["id"] for r in store.iter()}
+    stats = {"imported": 0, "duplicates": 0, "invalid": 0}
+    pending = []
+    for batch in parsed_batches(f, fmt, batch_size, workers):
+        for report in batch:
+            if report is None:
+                stats["invalid"] += 1
+                continue
+            key = report_key(report)
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            report["id"] = key
+            pending.append(report)
+        if len(pending) >= batch_size:
+            store.append_many(pending)
+            stats["imported"] += len(pending)
+            pending = []
+    store.append_many(pending)
+    stats["imported"] += len(pending)
+    return stats
+
+def export_reports(base_dir, f, fmt):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for report in get_report_store(base_dir).iter():
+            writer.writerow(report)
+            count += 1
+    else:
+        for report in get_report_store(base_dir).iter():
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path and path.lower().endswith(".csv") else "jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export of SwachhMap reports (JSONL or CSV).")
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="append reports from a file (or - for stdin)")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["jsonl", "csv"])
+    imp.add_argument("--batch-size", type=int, default=5000)
+    imp.add_argument("--workers", type=int, default=0, help="parse chunks in this many processes")
+    exp = sub.add_parser("export", help="write every report to a file (or - for stdout)")
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=["jsonl", "csv"])
+    args = parser.parse_args(argv)
+
+    fmt = _format(args.path, args.format)
+    start = time.perf_counter()
+    if args.command == "import":
+        f = sys.stdin if args.path == "-" else open(args.path, "r", encoding="utf-8", newline="")
+        with f:
+            stats = import_reports(args.base_dir, f, fmt, args.batch_size, args.workers)
+        total = sum(stats.values())
+        summary = ", ".join(f"{v} {k}" for k, v in stats.items())
+    else:
+        f = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8", newline="")
+        with f:
+            total = export_reports(args.base_dir, f, fmt)
+        summary = f"{total} exported"
+    elapsed = time.perf_counter() - start
+    print(f"{summary} in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} records/sec)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os, threading
+from data_store import get_report_store
+from auth import get_user_directory
+from ledger import get_ledger
+
+# One process-wide view over the report store, user directory and token
+# ledger. Sessions keep a cursor and only pull what changed since their last
+# rerun; an unchanged version means there is nothing to recompute.
+class SharedState:
+    def __init__(self, base_dir):
+        self.reports = get_report_store(base_dir)
+        self.users = get_user_directory(base_dir)
+        self.ledger = get_ledger(base_dir)
+
+    def version(self):
+        return (self.reports.current_version(), self.users.current_version(), self.ledger.current_version())
+
+    def sync(self, session):
+        # `session` is any dict-like (st.session_state). Returns
+        # (changed, deltas); deltas is None on first sync or after a compaction.
+        version = self.version()
+        if session.get("shared_version") == version:
+            return False, []
+        cursor, deltas = self.reports.changes_since(session.get("shared_cursor"))
+        first = "shared_cursor" not in session
+        session["shared_version"] = version
+        session["shared_cursor"] = cursor
+        return True, (None if first else deltas)
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def get_shared_state(base_dir):
+    key = os.path.abspath(base_dir)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = SharedState(base_dir)
+        return _shared[key]
@@ -0,0 +1,16 @@
+import os, sys
+import pytest
+
+# the app is a flat set of modules at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(params=["sqlite", "json"])
+def storage(request, monkeypatch):
+    monkeypatch.setenv("SWACHHMAP_STORAGE", request.param)
+    return request.param
+
+def make_report(i=0, **fields):
+    report = {"username": f"user{i % 3}", "location": f"Kolkata {i}", "description": "Garbage dump",
+              "image": None, "timestamp": f"2025-09-{1 + i % 28:02d}T10:00:{i % 60:02d}", "status": "Pending"}
+    report.update(fields)
+    return report
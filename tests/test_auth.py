@@ -0,0 +1,16 @@
+import hashlib, json
+from auth import UserDirectory, authenticate_user, verify_password
+
+def test_legacy_hash_verifies_and_needs_rehash():
+    stored = hashlib.sha256(b"secret").hexdigest()
+    assert verify_password("secret", stored) == (True, True)
+    assert verify_password("wrong", stored) == (False, True)
+    assert verify_password("secret", "sécret") == (False, True)  # non-ASCII entry, no TypeError
+
+def test_legacy_hashes_are_scrubbed_after_import(tmp_path, storage):
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    (tmp_path / "users.json").write_text(json.dumps({"amy": {"password": legacy, "tokens": 7}, "ben": legacy}))
+    UserDirectory(str(tmp_path))
+    assert json.loads((tmp_path / "users.json").read_text()) == {"amy": {"tokens": 7}, "ben": {"tokens": 0}}
+    assert authenticate_user("amy", "secret", str(tmp_path))
+    assert not verify_password("secret", UserDirectory(str(tmp_path)).get("amy")["password"])[1]
@@ -0,0 +1,76 @@
+import data_store
+from data_store import ReportStore
+from conftest import make_report
+
+def test_reports_replay_in_a_new_instance(tmp_path, storage):
+    store = ReportStore(str(tmp_path))
+    ids = store.append_many([make_report(i) for i in range(5)])
+    store.update_status(ids[1], "Resolved")
+    store.update(ids[2], lat=22.5, lon=88.3)
+    fresh = ReportStore(str(tmp_path))
+    assert [r["id"] for r in fresh.all()] == ids
+    assert fresh.get(ids[1])["status"] == "Resolved"
+    assert fresh.get(ids[1])["resolved_at"]
+    assert fresh.get(ids[2])["lat"] == 22.5
+
+def test_legacy_reports_are_imported_with_stable_ids(tmp_path, storage):
+    legacy = [make_report(i) for i in range(3)]
+    data_store.save_json_file(str(tmp_path / "reports.json"), legacy)
+    first = [r["id"] for r in ReportStore(str(tmp_path)).all()]
+    assert first == [data_store.legacy_report_id(r) for r in legacy]
+    assert [r["id"] for r in ReportStore(str(tmp_path)).all()] == first
+
+def test_compaction_keeps_state_and_other_writers(tmp_path, storage):
+    store = ReportStore(str(tmp_path))
+    ids = store.append_many([make_report(i) for i in range(4)])
+    store.update_status(ids[0], "In Progress")
+    # a second writer appends without the first one having seen it yet
+    other = ReportStore(str(tmp_path))
+    late = other.append(make_report(99))
+    store.compact()
+    for reader in (store, ReportStore(str(tmp_path))):
+        assert [r["id"] for r in reader.all()] == ids + [late]
+        assert reader.get(ids[0])["status"] == "In Progress"
+    assert other.get(late) is not None
+    assert len(other.all()) == 5
+
+def test_torn_trailing_line_is_repaired(tmp_path, monkeypatch):
+    monkeypatch.setenv("SWACHHMAP_STORAGE", "json")
+    store = ReportStore(str(tmp_path))
+    store.append(make_report(0))
+    with open(tmp_path / "reports.jsonl", "ab") as f:
+        f.write(b'{"op":"add","rep')  # a crashed writer's partial line
+    restarted = ReportStore(str(tmp_path))
+    report_id = restarted.append(make_report(1))
+    assert restarted.get(report_id) is not None
+    assert report_id in [r["id"] for r in ReportStore(str(tmp_path)).all()]
+
+def test_find_and_page_match_a_plain_scan(tmp_path, storage):
+    store = ReportStore(str(tmp_path))
+    reports = [make_report(i, status=["Pending", "In Progress", "Resolved"][i % 3]) for i in range(60)]
+    store.append_many(reports)
+    everything = store.all()
+    for status, text in [("Pending", None), (None, "kolkata 1"), ("Resolved", "user2"), (None, None)]:
+        expected = [r for r in everything
+                    if (status is None or r["status"] == status)
+                    and (not text or text in r["location"].lower() or text in r["username"].lower())]
+        positions = store.find(status=status, text=text)
+        paged, cursor = [], None
+        while True:
+            page, cursor = store.page(cursor, 7, positions)
+            paged += page
+            if cursor is None:
+                break
+        assert paged == expected[::-1]
+
+def test_changes_since_reports_changed_fields(tmp_path, storage):
+    store = ReportStore(str(tmp_path))
+    cursor = store.cursor()
+    report_id = store.append(make_report(0))
+    store.update(report_id, lat=22.5, lon=88.3)
+    store.update_status(report_id, "In Progress")
+    _, deltas = store.changes_since(cursor)
+    assert [(kind, fields) for kind, _, fields in deltas] == [
+        ("add", None), ("update", ("lat", "lon")), ("update", ("status",))]
+    store.compact()
+    assert store.changes_since(cursor)[1] is None
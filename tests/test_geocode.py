@@ -0,0 +1,72 @@
+import threading, time
+from geocode import GeoCache, parse_latlon
+
+class StubGeocoder:
+    def __init__(self, known=None, fail=()):
+        self.known = known or {}
+        self.fail = set(fail)
+        self.calls = []
+
+    def __call__(self, name):
+        self.calls.append(name)
+        if name in self.fail:
+            raise IOError("provider down")
+        return self.known.get(name)
+
+def make_cache(tmp_path, geocoder):
+    return GeoCache(str(tmp_path / "geocache.json"), geocoder=geocoder, min_interval=0)
+
+def test_lookup_hits_provider_once(tmp_path):
+    stub = StubGeocoder({"Salt Lake": {"lat": 22.58, "lon": 88.41}})
+    cache = make_cache(tmp_path, stub)
+    assert cache.lookup("Salt Lake", wait=5) == {"lat": 22.58, "lon": 88.41}
+    assert cache.lookup("  salt   LAKE ", wait=5) == {"lat": 22.58, "lon": 88.41}
+    assert stub.calls == ["Salt Lake"]
+
+def test_not_found_is_cached_but_failures_are_not(tmp_path):
+    stub = StubGeocoder(fail={"Howrah"})
+    cache = make_cache(tmp_path, stub)
+    assert cache.lookup("Nowhere", wait=5) is None
+    assert cache.cached("Nowhere") == (True, None)
+    assert cache.lookup("Howrah", wait=5) is None
+    assert cache.cached("Howrah") == (False, None)
+    stub.fail.clear()
+    stub.known["Howrah"] = {"lat": 22.59, "lon": 88.31}
+    assert cache.lookup("Howrah", wait=5) == {"lat": 22.59, "lon": 88.31}
+
+def test_cache_persists_across_instances(tmp_path):
+    stub = StubGeocoder({"Garia": {"lat": 22.46, "lon": 88.39}})
+    cache = make_cache(tmp_path, stub)
+    cache.lookup("Garia", wait=5)
+    cache.flush()
+    again = make_cache(tmp_path, StubGeocoder())
+    assert again.get("Garia") == {"lat": 22.46, "lon": 88.39}
+
+def test_resolve_async_runs_callback(tmp_path):
+    cache = make_cache(tmp_path, StubGeocoder({"Barasat": {"lat": 22.72, "lon": 88.48}}))
+    done = threading.Event()
+    results = []
+    assert cache.resolve_async("Barasat", lambda coords: (results.append(coords), done.set()))
+    assert done.wait(5)
+    assert results == [{"lat": 22.72, "lon": 88.48}]
+    # now cached: the callback runs inline and nothing is pending
+    assert not cache.resolve_async("Barasat", results.append)
+    assert len(results) == 2
+
+def test_worker_restarts_after_idle_exit(tmp_path, monkeypatch):
+    import geocode
+    real_get = geocode.queue.Queue.get
+    # shorten the idle timeout so the worker exits quickly
+    monkeypatch.setattr(geocode.queue.Queue, "get", lambda self, timeout=None: real_get(self, timeout=0.05))
+    cache = make_cache(tmp_path, StubGeocoder({"a": {"lat": 1.0, "lon": 1.0}, "b": {"lat": 2.0, "lon": 2.0}}))
+    assert cache.lookup("a", wait=5)
+    deadline = time.monotonic() + 5
+    while cache._worker is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.lookup("b", wait=5) == {"lat": 2.0, "lon": 2.0}
+    assert not cache._inflight
+
+def test_parse_latlon():
+    assert parse_latlon("22.5726, 88.3639") == {"lat": 22.5726, "lon": 88.3639}
+    assert parse_latlon("Sector 5, 12") is None
+    assert parse_latlon("95.0, 88.0") is None
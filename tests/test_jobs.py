@@ -0,0 +1,99 @@
+import time
+import pytest
+import jobs
+from jobs import JobQueue
+
+@pytest.fixture
+def handlers(monkeypatch):
+    calls = []
+    monkeypatch.setattr(JobQueue, "RETRY_DELAY", 0.01)
+    monkeypatch.setitem(jobs.HANDLERS, "ok", lambda base_dir, payload: calls.append(payload["n"]))
+    return calls
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_failures_retry_with_backoff(tmp_path, storage, monkeypatch, handlers):
+    tries = []
+    def flaky(base_dir, payload):
+        tries.append(time.time())
+        if len(tries) < 3:
+            raise RuntimeError("try again")
+    monkeypatch.setitem(jobs.HANDLERS, "flaky", flaky)
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue("flaky", {})
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert len(tries) == 3
+    # retry n waits RETRY_DELAY * 2**n
+    assert tries[1] - tries[0] >= 0.02 and tries[2] - tries[1] >= 0.04
+
+def test_gives_up_after_max_attempts(tmp_path, storage, monkeypatch, handlers):
+    tries = []
+    def broken(base_dir, payload):
+        tries.append(1)
+        raise RuntimeError("nope")
+    monkeypatch.setitem(jobs.HANDLERS, "broken", broken)
+    monkeypatch.setattr(JobQueue, "MAX_ATTEMPTS", 3)
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue("broken", {})
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert len(tries) == 3
+
+def test_pending_jobs_resume_after_restart(tmp_path, storage, handlers):
+    JobQueue(str(tmp_path), start=False).enqueue("ok", {"n": 1}, key="job:1")
+    queue = JobQueue(str(tmp_path))
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert handlers == [1]
+    assert not JobQueue(str(tmp_path), start=False).enqueue("ok", {"n": 1}, key="job:1")
+
+def test_compaction_keeps_pending_jobs_and_keys(tmp_path, storage, monkeypatch, handlers):
+    monkeypatch.setattr(JobQueue, "COMPACT_MIN_EVENTS", 10)
+    queue = JobQueue(str(tmp_path), start=False)
+    queue.enqueue_many([("ok", {"n": i}, f"job:{i}" if i < 5 else None) for i in range(40)])
+    queue._record([{"op": "done", "id": job_id} for job_id in list(queue._pending)[3:36]])
+    queue._record([{"op": "retry", "id": job_id, "attempts": 2, "run_after": 0} for job_id in queue._pending])
+    assert queue._log.events < 40
+    restarted = JobQueue(str(tmp_path), start=False)
+    assert restarted._pending == queue._pending and len(restarted._pending) == 7
+    assert {job["attempts"] for job in restarted._pending.values()} == {2}
+    # keys of done and pending jobs both still block a repeat
+    assert restarted.enqueue_many([("ok", {"n": i}, f"job:{i}") for i in range(6)]) == 1
+
+def test_two_processes_run_a_job_once(tmp_path, storage, monkeypatch, handlers):
+    def slow(base_dir, payload):
+        handlers.append(payload["n"])
+        time.sleep(0.3)
+    monkeypatch.setitem(jobs.HANDLERS, "slow", slow)
+    first, second = JobQueue(str(tmp_path)), JobQueue(str(tmp_path))
+    first.enqueue("slow", {"n": 1})
+    wait_for(lambda: first.pending() == 0 and second.pending() == 0)
+    time.sleep(0.1)
+    first.stop()
+    second.stop()
+    assert handlers == [1]
+
+def test_expired_lease_is_claimed_again(tmp_path, storage, handlers):
+    crashed = JobQueue(str(tmp_path), start=False)
+    crashed.enqueue("ok", {"n": 1})
+    job_id = next(iter(crashed._pending))
+    crashed._record([{"op": "claim", "id": job_id, "owner": crashed.owner, "until": time.time() + 0.2}])
+    queue = JobQueue(str(tmp_path))
+    time.sleep(0.1)
+    assert handlers == []
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert handlers == [1]
+
+def test_racing_enqueues_share_a_key(tmp_path, storage, handlers):
+    first, second = JobQueue(str(tmp_path), start=False), JobQueue(str(tmp_path), start=False)
+    assert first.enqueue("ok", {"n": 1}, key="job:1")
+    assert not second.enqueue("ok", {"n": 2}, key="job:1")
+    event = {"op": "enqueue", "kind": "ok", "payload": {"n": 3}, "key": "job:2", "ts": time.time()}
+    first._log.append([dict(event, id="a"), dict(event, id="b")])  # as left by an older, racy writer
+    assert sorted(job["key"] for job in JobQueue(str(tmp_path), start=False)._pending.values()) == ["job:1", "job:2"]
@@ -0,0 +1,45 @@
+from ledger import TokenLedger
+
+def test_repeated_key_credits_once(tmp_path, storage):
+    ledger = TokenLedger(str(tmp_path))
+    assert ledger.credit_many([("alice", 10, "report"), ("alice", 5, "image bonus")], key="report:1")
+    assert not ledger.credit_many([("alice", 10, "report"), ("alice", 5, "image bonus")], key="report:1")
+    assert ledger.balance("alice") == 15
+
+def test_keys_survive_restart_and_compaction(tmp_path, storage):
+    ledger = TokenLedger(str(tmp_path))
+    ledger.credit("bob", 10, "report", key="report:2")
+    ledger.credit("bob", 7, "manual")
+    ledger.compact()
+    restarted = TokenLedger(str(tmp_path))
+    assert restarted.balance("bob") == 17
+    assert not restarted.credit("bob", 10, "report", key="report:2")
+    assert restarted.balance("bob") == 17
+
+def test_other_instances_see_credits(tmp_path, storage):
+    first, second = TokenLedger(str(tmp_path)), TokenLedger(str(tmp_path))
+    first.credit("carol", 10, "report", key="report:3")
+    assert not second.credit("carol", 10, "report", key="report:3")
+    assert second.balance("carol") == 10
+
+def test_opening_balances_come_from_legacy_files(tmp_path, storage):
+    import json
+    (tmp_path / "user_tokens.json").write_text(json.dumps({"dave": 40}))
+    (tmp_path / "users.json").write_text(json.dumps({"dave": {"password": "x", "tokens": 99},
+                                                       "erin": {"password": "y", "tokens": 5}}))
+    ledger = TokenLedger(str(tmp_path))
+    assert ledger.balances() == {"dave": 40, "erin": 5}
+
+def test_racing_writers_pay_a_key_once(tmp_path, storage):
+    first, second = TokenLedger(str(tmp_path)), TokenLedger(str(tmp_path))
+    second.balance("frank")  # second has caught up before first writes
+    assert first.credit("frank", 10, "report", key="k1")
+    assert not second.credit("frank", 10, "report", key="k1")
+    assert second.balance("frank") == 10
+    assert TokenLedger(str(tmp_path)).balance("frank") == 10
+
+def test_replay_ignores_a_key_logged_twice(tmp_path, storage):
+    ledger = TokenLedger(str(tmp_path))
+    event = {"op": "credit", "entries": [["gina", 10, "report"]], "key": "k2"}
+    ledger._log.append([event, dict(event)])  # as left by an older, racy writer
+    assert TokenLedger(str(tmp_path)).balance("gina") == 10
@@ -0,0 +1,39 @@
+import threading
+from locate import LocationService
+
+KOLKATA = {"label": "Kolkata, West Bengal, IN", "lat": 22.5726, "lon": 88.3639}
+
+def test_detect_uses_provider_and_caches_per_client():
+    calls = []
+    def provider(ip, timeout):
+        calls.append(ip)
+        return KOLKATA
+    service = LocationService(provider=provider)
+    assert service.detect("client-1", "203.0.113.5").result(5) == KOLKATA
+    assert service.detect("client-1", "203.0.113.5").result(5) == KOLKATA
+    assert calls == ["203.0.113.5"]
+
+def test_concurrent_detects_share_one_lookup():
+    release = threading.Event()
+    calls = []
+    def provider(ip, timeout):
+        calls.append(ip)
+        release.wait(5)
+        return KOLKATA
+    service = LocationService(provider=provider)
+    first = service.detect("client-1")
+    second = service.detect("client-1")
+    release.set()
+    assert first.result(5) == second.result(5) == KOLKATA
+    assert len(calls) == 1
+
+def test_provider_errors_resolve_to_none_and_are_not_cached():
+    outcomes = [IOError("timeout"), KOLKATA]
+    def provider(ip, timeout):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    service = LocationService(provider=provider)
+    assert service.detect("client-1").result(5) is None
+    assert service.detect("client-1").result(5) == KOLKATA
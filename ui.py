@@ -2,20 +2,24 @@
 import streamlit as st
 import time
 from datetime import datetime
-from data_store import get_default_files, load_json_file, save_json_file
+from data_store import get_default_files, get_report_store
 from auth import (authenticate_user, save_user, add_tokens, get_user_tokens)
-import os
-from functools import lru_cache
-from geopy.geocoders import Nominatim
+import os, uuid
+import metrics
+# Geocoding, HTTP location lookup, image handling, the map and analytics are
+# imported inside the pages that use them, so the home and login pages start
+# without them. The upload directory is created by store_upload on first use.
 
 BASE_DIR = os.path.dirname(__file__)
 PATHS = get_default_files(BASE_DIR)
 UPLOAD_DIR = PATHS['UPLOAD_DIR']
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # --- Styles and UI ---
-def apply_custom_styles():
-    st.markdown("""<style>
+def _compact(html):
+    # static markup is flattened once at import instead of on every rerun
+    return " ".join(line.strip() for line in html.splitlines() if line.strip())
+
+_CUSTOM_STYLES = _compact("""<style>
     /* simplified CSS from original to keep exact look */
     [data-testid="stAppViewContainer"] {
         border: 5px solid #1e3c72;
@@ -32,44 +36,10 @@ def apply_custom_styles():
     }
     .hero { background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%); color:white; padding:2rem; border-radius:12px; margin-bottom:1rem; }
     .auth-form { background:white; padding:1rem; border-radius:12px; border:2px solid #1e3c72; }
-    </style>""", unsafe_allow_html=True)
-
-def show_footer():
-    st.markdown("""<div style='background-color:#1e3c72;color:white;padding:1rem;border-radius:12px;'>
-        <div style='display:flex;justify-content:space-between;flex-wrap:wrap;'>
-            <div><h3 style='color:#2E86AB;'>SwacchMap</h3><p>Empowering communities...</p></div>
-            <div><h4 style='color:#2E86AB;'>Quick Links</h4><p>Home</p><p>Features</p></div>
-            <div><h4 style='color:#2E86AB;'>Support</h4><p>Help Center</p></div>
-        </div>
-        <div style='text-align:center;margin-top:1rem;border-top:1px solid #6c757d;padding-top:0.5rem;'>
-            <p>© 2025 SwachhMap. All rights reserved.</p>
-        </div>
-    </div>""", unsafe_allow_html=True)
-
-# Home, Login, Signup, and main app functions closely mirror original file's UI and behaviour.
-def show_home_page():
-    apply_custom_styles()
-
-    # --- Header ---
-    st.markdown(
-        """<h1 style='text-align:center;color:#1e3c72;margin-top:0;'>
-        SwachhMap <span style='font-size:1rem;color:#2a5298;'>Nexagen</span></h1>""",
-        unsafe_allow_html=True
-    )
-
-    col1, col2, col3 = st.columns([8, 1, 1])
-    with col2:
-        if st.button("Log in", key="top_login_btn"):
-            st.session_state.page = "login"
-            st.rerun()
-    with col3:
-        if st.button("Sign Up", key="top_signup_btn"):
-            st.session_state.page = "signup"
-            st.rerun()
-
-    # --- Hero Section ---
-    st.markdown(
-        """
+    </style>""")
+_HOME_HEADER = _compact("""<h1 style='text-align:center;color:#1e3c72;margin-top:0;'>
+        SwachhMap <span style='font-size:1rem;color:#2a5298;'>Nexagen</span></h1>""")
+_HOME_HERO = _compact("""
         <div style='width:100%;background:linear-gradient(135deg,#1e3c72 0%,#2a5298 100%);
                     color:white;padding:3rem 1rem;border-radius:12px;
                     margin:2rem 0;text-align:center;'>
@@ -79,17 +49,9 @@ def show_home_page():
                 citizen reporting, and municipal management for a cleaner India.
             </p>
         </div>
-        """,
-        unsafe_allow_html=True
-    )
-
-    # --- Watch Demo Button (shows video inline) ---
-    if st.button("▶ Watch Demo"):
-        st.video(r"D:\Nexagen\WhatsApp Video 2025-09-10 at 20.03.21_c1113534.mp4")
-
-    # --- Stats Section ---
-    st.markdown(
-        """
+        """)
+# stats and footer are adjacent, so they go out as a single element
+_HOME_STATS_AND_FOOTER = _compact("""
         <div style='width:100%;margin:2rem 0;text-align:center;'>
             <div style='display:flex;justify-content:space-around;flex-wrap:wrap;'>
                 <div style='margin:1rem;'>
@@ -106,13 +68,7 @@ def show_home_page():
                 </div>
             </div>
         </div>
-        """,
-        unsafe_allow_html=True
-    )
-
-    # --- Footer Section ---
-    st.markdown(
-        """
+        """ + """
         <div style='width:100%;background:#1e3c72;color:white;padding:2rem;
                     border-radius:12px;margin-top:2rem;'>
             <div style='display:flex;justify-content:space-between;flex-wrap:wrap;'>
@@ -140,7 +96,56 @@ def show_home_page():
                 <p>© 2025 SwachhMap. All rights reserved. Building cleaner cities through technology.</p>
             </div>
         </div>
-        """,
+        """)
+
+def apply_custom_styles():
+    st.markdown(_CUSTOM_STYLES, unsafe_allow_html=True)
+
+def show_footer():
+    st.markdown("""<div style='background-color:#1e3c72;color:white;padding:1rem;border-radius:12px;'>
+        <div style='display:flex;justify-content:space-between;flex-wrap:wrap;'>
+            <div><h3 style='color:#2E86AB;'>SwacchMap</h3><p>Empowering communities...</p></div>
+            <div><h4 style='color:#2E86AB;'>Quick Links</h4><p>Home</p><p>Features</p></div>
+            <div><h4 style='color:#2E86AB;'>Support</h4><p>Help Center</p></div>
+        </div>
+        <div style='text-align:center;margin-top:1rem;border-top:1px solid #6c757d;padding-top:0.5rem;'>
+            <p>© 2025 SwachhMap. All rights reserved.</p>
+        </div>
+    </div>""", unsafe_allow_html=True)
+
+# Home, Login, Signup, and main app functions closely mirror original file's UI and behaviour.
+def show_home_page():
+    apply_custom_styles()
+
+    # --- Header ---
+    st.markdown(
+        _HOME_HEADER,
+        unsafe_allow_html=True
+    )
+
+    col1, col2, col3 = st.columns([8, 1, 1])
+    with col2:
+        if st.button("Log in", key="top_login_btn"):
+            st.session_state.page = "login"
+            st.rerun()
+    with col3:
+        if st.button("Sign Up", key="top_signup_btn"):
+            st.session_state.page = "signup"
+            st.rerun()
+
+    # --- Hero Section ---
+    st.markdown(
+        _HOME_HERO,
+        unsafe_allow_html=True
+    )
+
+    # --- Watch Demo Button (shows video inline) ---
+    if st.button("▶ Watch Demo"):
+        st.video(r"D:\Nexagen\WhatsApp Video 2025-09-10 at 20.03.21_c1113534.mp4")
+
+    # --- Stats and Footer Sections ---
+    st.markdown(
+        _HOME_STATS_AND_FOOTER,
         unsafe_allow_html=True
     )
 
@@ -220,7 +225,7 @@ def show_signup_page():
         elif password != confirm:
             st.error("Passwords do not match.")
         elif save_user(username, password, BASE_DIR):
-            add_tokens(username, 0, BASE_DIR)
+            add_tokens(username, 0, BASE_DIR, reason="signup")
             st.success("Account created — please login.")
             time.sleep(1)
             st.session_state.page = "login"
@@ -235,36 +240,63 @@ def show_signup_page():
 
 # Reports, Map, and View Reports
 def load_reports():
-    return load_json_file(PATHS['REPORT_FILE'], [])
+    return get_report_store(BASE_DIR).all()
 
 def save_report(report):
-    reports = load_reports()
-    reports.append(report)
-    save_json_file(PATHS['REPORT_FILE'], reports)
+    get_report_store(BASE_DIR).append(report)
+
+def _client_ip():
+    context = getattr(st, "context", None)
+    return getattr(context, "ip_address", None)
+
+def _client_key():
+    if "client_id" not in st.session_state:
+        st.session_state.client_id = _client_ip() or uuid.uuid4().hex
+    return st.session_state.client_id
+
+@st.fragment(run_every=1)
+def show_location_detection_status():
+    # polls the pending lookup without rerunning the rest of the form; only
+    # rendered while a lookup is pending, so idle sessions are not polled
+    future = st.session_state.get("location_detection")
+    if future is None:
+        return
+    if not future.done():
+        st.caption("📡 Detecting location…")
+        return
+    del st.session_state.location_detection
+    result = future.result()
+    st.session_state.detected_location = result if result and result.get("label") else {}
+    st.rerun()
 
 def show_report_issue():
+    from geocode import get_geocache, parse_latlon
+    from uploads import store_upload
+    from jobs import get_job_queue
+    from locate import get_location_service
+    from dedupe import get_duplicate_index
     st.subheader("📤 Report a Cleanliness Issue")
-    import requests
-    detected_location = ""
+    if st.session_state.pop("report_submitted", False):
+        duplicate_of = st.session_state.pop("report_duplicate_of", None)
+        if duplicate_of:
+            st.warning(f"This looks like a duplicate of report {duplicate_of}. It was linked to that report and no tokens were credited.")
+        else:
+            st.success("✅ Report submitted successfully!")
+            st.balloons()
+    detected = st.session_state.pop("detected_location", None)
+    if detected:
+        # applied before the input is created so it can take the new value
+        st.session_state.report_location_input = detected["label"]
+        st.session_state.detected_coords = dict(detected, location=detected["label"])
+        st.success(f"Detected location: {detected['label']}")
+    elif detected is not None:
+        st.warning("Could not detect location automatically.")
     if st.button("📍 Detect My Location (via IP)"):
-        try:
-            ip_req = requests.get("https://ipinfo.io/json")
-            if ip_req.status_code == 200:
-                data = ip_req.json()
-                city = data.get("city", "")
-                region = data.get("region", "")
-                country = data.get("country", "")
-                loc = data.get("loc", "")
-                detected_location = ", ".join([city, region, country]).strip(", ")
-                if loc:
-                    detected_location += f" ({loc})"
-                st.success(f"Detected location: {detected_location}")
-            else:
-                st.warning("Could not detect location automatically.")
-        except Exception:
-            st.warning("Could not detect location automatically.")
+        st.session_state.location_detection = get_location_service().detect(_client_key(), _client_ip())
+    if "location_detection" in st.session_state:
+        show_location_detection_status()
 
-    location = st.text_input("Location", value=detected_location, key="report_location_input")
+    location = st.text_input("Location", key="report_location_input")
     description = st.text_area("Issue Description", key="report_description_input")
     image = st.file_uploader("Upload an image (optional)", type=['jpg','jpeg','png'], key="report_image_input")
     if st.button("Submit Report"):
@@ -272,10 +304,10 @@ def show_report_issue():
             st.error("Please provide both location and description.")
         else:
             filename = None
+            dedupe = get_duplicate_index(BASE_DIR)
             if image:
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{image.name}"
-                with open(os.path.join(UPLOAD_DIR, filename), "wb") as f:
-                    f.write(image.read())
+                filename = store_upload(BASE_DIR, image.getvalue(), image.name)
+                dedupe.remember(filename, image.getvalue())
             report = {
                 "username": st.session_state.username or "Unknown User",
                 "location": location,
@@ -284,41 +316,74 @@ def show_report_issue():
                 "timestamp": datetime.now().isoformat(),
                 "status": "Pending"
             }
-            with st.spinner("Submitting report..."):
-                save_report(report)
-                add_tokens(st.session_state.username, 10, BASE_DIR)
-                if image:
-                    add_tokens(st.session_state.username, 5, BASE_DIR)
-                st.session_state.tokens = get_user_tokens(st.session_state.username, BASE_DIR)
-                time.sleep(0.3)
-            st.success("✅ Report submitted successfully!")
-            st.balloons()
-            time.sleep(0.2)
+            detected = st.session_state.get("detected_coords") or {}
+            coords = parse_latlon(location)
+            if not coords and detected.get("lat") is not None and detected.get("location") == location:
+                coords = detected
+                report["located_by"] = "ip"
+            if not coords:
+                coords = get_geocache(BASE_DIR).get(location)
+            if coords:
+                report["lat"], report["lon"] = coords["lat"], coords["lon"]
+            duplicate_of = dedupe.duplicate_of(report)
+            if duplicate_of:
+                report["duplicate_of"] = duplicate_of
+            save_report(report)
+            # every follow-up job goes out in one durable write
+            jobs = []
+            credits = [] if duplicate_of else [(st.session_state.username, 10, "report")]
+            if image:
+                if not duplicate_of:
+                    credits.append((st.session_state.username, 5, "image bonus"))
+                jobs.append(("thumbnail", {"image": filename}, f"thumbnail:{filename}"))
+            if credits:
+                jobs.append(("credit", {"entries": credits, "key": f"report:{report['id']}"}, f"credit:{report['id']}"))
+            if not coords:
+                jobs.append(("geocode", {"report_id": report["id"], "location": location}, f"geocode:{report['id']}"))
+            if jobs:
+                get_job_queue(BASE_DIR).enqueue_many(jobs)
+            st.session_state.tokens = get_user_tokens(st.session_state.username, BASE_DIR) + sum(c[1] for c in credits)
+            st.session_state.report_submitted = True
+            st.session_state.report_duplicate_of = report.get("duplicate_of")
             st.rerun()
 
+def save_report_status(report_id):
+    # runs as a button callback, before the rerun renders the page, so the
+    # new status shows up without a second rerun
+    new_status = st.session_state[f'status_{report_id}']
+    updated_report = get_report_store(BASE_DIR).update_status(report_id, new_status)
+    if updated_report and new_status == 'Resolved':
+        add_tokens(updated_report.get('username'), 20, BASE_DIR, reason="resolved", key=f"resolved:{report_id}")
+    st.session_state.status_saved = report_id
+
 def show_view_reports():
+    from uploads import display_path, image_path
     st.subheader("📋 Submitted Reports")
-    reports = load_reports()
+    store = get_report_store(BASE_DIR)
     status_filter = st.selectbox("Filter by status", ["All","Pending","In Progress","Resolved"], key="filter_status")
     location_search = st.text_input("Search by location or user", key="search_box")
-    filtered = reports
-    if status_filter != "All":
-        filtered = [r for r in filtered if r.get("status","Pending")==status_filter]
-    if location_search:
-        q = location_search.lower()
-        filtered = [r for r in filtered if q in r.get("location","").lower() or q in r.get("username","").lower()]
-    if not filtered:
+    page_size = st.selectbox("Reports per page", [10, 25, 50, 100], key="page_size")
+    status = None if status_filter == "All" else status_filter
+    positions = store.find(status=status, text=location_search)
+    # cursors[i] is where page i starts in the newest-first walk; reset on filter change
+    filters = (status_filter, location_search, page_size)
+    if st.session_state.get("view_filters") != filters:
+        st.session_state.view_filters = filters
+        st.session_state.view_cursors = [None]
+    cursors = st.session_state.view_cursors
+    page_reports, next_cursor = store.page(cursors[-1], page_size, positions)
+    if not page_reports:
+        if len(cursors) > 1:
+            # the reports past the saved cursor are gone (e.g. status changed); start over
+            st.session_state.view_cursors = [None]
+            st.rerun()
         st.info("No reports match your filters.")
         return
-    updated = False
-    for idx, report in enumerate(reversed(filtered)):
-        all_reports = load_reports()
-        key = (report.get("username"), report.get("timestamp"), report.get("location"))
-        report_index = None
-        for i, ar in enumerate(all_reports):
-            if (ar.get("username"), ar.get("timestamp"), ar.get("location")) == key:
-                report_index = i
-                break
+    total = store.count() if positions is None else len(positions)
+    page_no = len(cursors)
+    st.caption(f"Page {page_no} of {max(1, -(-total // page_size))} · {total} report(s)")
+    for report in page_reports:
+        report_id = report.get("id")
         st.markdown("---")
         st.markdown(f"*User:* {report.get('username','Unknown')}")
         st.markdown(f"*Location:* {report.get('location','N/A')}")
@@ -327,110 +392,177 @@ def show_view_reports():
         color = {'Pending':'orange','In Progress':'blue','Resolved':'green'}.get(status,'gray')
         st.markdown(f"*Status:* <span style='color:{color}; font-weight:bold'>{status}</span>", unsafe_allow_html=True)
         st.markdown(f"*Timestamp:* {report.get('timestamp','N/A')}")
+        if report.get('duplicate_of'):
+            st.caption(f"Possible duplicate of report {report['duplicate_of']}")
         if report.get('image'):
-            img_path = os.path.join(UPLOAD_DIR, report['image'])
-            if os.path.exists(img_path):
+            img_path = display_path(BASE_DIR, report['image'])
+            if img_path:
                 st.image(img_path, width=300)
-        if st.session_state.username and st.session_state.username.lower() == 'admin' and report_index is not None:
+                if st.button('View full size', key=f'full_{report_id}'):
+                    st.image(image_path(BASE_DIR, report['image']))
+        if st.session_state.username and st.session_state.username.lower() == 'admin' and report_id:
             status_options = ['Pending','In Progress','Resolved']
-            current = all_reports[report_index].get('status','Pending')
             try:
-                default_idx = status_options.index(current)
+                default_idx = status_options.index(status)
             except ValueError:
                 default_idx = 0
-            new_status = st.selectbox('Update status', status_options, index=default_idx, key=f'status_{report_index}')
-            if st.button('Save status', key=f'save_{report_index}'):
-                all_reports[report_index]['status'] = new_status
-                save_json_file(PATHS['REPORT_FILE'], all_reports)
-                if new_status == 'Resolved':
-                    resolved_user = all_reports[report_index].get('username')
-                    add_tokens(resolved_user, 20, BASE_DIR)
+            st.selectbox('Update status', status_options, index=default_idx, key=f'status_{report_id}')
+            st.button('Save status', key=f'save_{report_id}', on_click=save_report_status, args=(report_id,))
+            if st.session_state.get("status_saved") == report_id:
                 st.success('Status updated.')
-                updated = True
-    if updated:
-        time.sleep(0.2)
+    st.markdown("---")
+    prev_col, next_col = st.columns(2)
+    if page_no > 1 and prev_col.button("⬅ Previous", key="view_prev"):
+        cursors.pop()
         st.rerun()
-
-@lru_cache(maxsize=256)
-def geocode_lru(location_name):
-    try:
-        geolocator = Nominatim(user_agent='swacchmap')
-        return geolocator.geocode(location_name, timeout=10)
-    except Exception:
-        return None
-
-def geocode_location(location_name):
-    try:
-        geolocator = Nominatim(user_agent='swacchmap_app')
-        location = geolocator.geocode(location_name)
-        if location:
-            return {'lat': location.latitude, 'lon': location.longitude}
-    except:
-        return None
+    if next_cursor is not None and next_col.button("Next ➡", key="view_next"):
+        cursors.append(next_cursor)
+        st.rerun()
+    st.session_state.pop("status_saved", None)
 
 def show_map_view():
     st.subheader("🗺 Map View of Reports")
-    reports = load_reports()
-    if not reports:
-        st.info("No reports to display.")
+    import folium
+    from streamlit_folium import st_folium
+    from geocode import geocode_report_async
+    from map_data import get_map_index, STATUSES
+    index = get_map_index(BASE_DIR)
+    unlocated = sum(1 for r in index.unlocated if geocode_report_async(BASE_DIR, r))
+    if unlocated:
+        st.info(f"Still locating {unlocated} report(s); they will appear on the next refresh.")
+    extent = index.bounds()
+    if extent is None:
+        if not unlocated:
+            st.warning("No valid location coordinates found.")
         return
-    map_data = []
-    for report in reports:
-        if report.get('location'):
-            loc = geocode_location(report['location'])
-            if loc:
-                map_data.append({'lat': loc['lat'], 'lon': loc['lon']})
-    if map_data:
-        st.map(map_data)
-    else:
-        st.warning("No valid location coordinates found.")
-
-def show_user_stats_sidebar():
-    reports = load_reports()
-    user_reports = [r for r in reports if isinstance(r, dict) and r.get('username') == st.session_state.username]
-    total = len(user_reports)
-    dates = sorted({r.get('timestamp','')[:10] for r in user_reports if r.get('timestamp')}, reverse=True)
-    streak = 0
-    today = datetime.now().date()
-    for i, d in enumerate(dates):
-        try:
-            dt = datetime.strptime(d, "%Y-%m-%d").date()
-            if (today - dt).days == i:
-                streak += 1
-            else:
-                break
-        except Exception:
-            continue
+    view = st.session_state.get("map_view") or {}
+    zoom = view.get("zoom", 5)
+    bounds = view.get("bounds") or extent
+    center = view.get("center") or [(extent[0] + extent[2]) / 2, (extent[1] + extent[3]) / 2]
+    clusters = index.visible(bounds, zoom)
+    fmap = folium.Map(location=center, zoom_start=zoom)
+    top = max(clusters['count'].max(), 1) if len(clusters) else 1
+    for lat, lon, count, *by_status in clusters.itertuples(index=False, name=None):
+        counts = dict(zip(STATUSES, by_status))
+        color = 'green' if counts['Pending'] == counts['In Progress'] == 0 else 'orange'
+        folium.CircleMarker(
+            [lat, lon], radius=4 + 16 * (count / top) ** 0.5, color=color, fill=True,
+            tooltip=f"{count} report(s): " + ", ".join(f"{n} {s}" for s, n in counts.items() if n),
+        ).add_to(fmap)
+    state = st_folium(fmap, key="report_map", height=500, returned_objects=["bounds", "zoom", "center"])
+    sw = ((state or {}).get("bounds") or {}).get("_southWest") or {}
+    if sw.get("lat") is not None:
+        ne = state["bounds"]["_northEast"]
+        new_view = {
+            "bounds": (sw["lat"], sw["lng"], ne["lat"], ne["lng"]),
+            "zoom": state.get("zoom") or zoom,
+            "center": [state["center"]["lat"], state["center"]["lng"]] if state.get("center") else center,
+        }
+        if new_view["zoom"] != zoom or new_view["bounds"] != view.get("bounds"):
+            st.session_state.map_view = new_view
+            st.rerun()
+
+def sidebar_data(changed):
+    # recomputed only when shared data changed (or the day rolled over)
+    from aggregates import get_aggregates
+    cache_key = (st.session_state.username, datetime.now().date())
+    cached = st.session_state.get("sidebar_cache")
+    if changed or not cached or cached[0] != cache_key:
+        agg = get_aggregates(BASE_DIR)
+        data = {
+            "total": agg.user_count(st.session_state.username),
+            "streak": agg.user_streak(st.session_state.username),
+            "tokens": get_user_tokens(st.session_state.username, BASE_DIR),
+            "leaderboard": agg.leaderboard(),
+        }
+        cached = st.session_state.sidebar_cache = (cache_key, data)
+    return cached[1]
+
+def show_user_stats_sidebar(data):
+    total = data["total"]
+    streak = data["streak"]
     st.sidebar.markdown(f"📊 *Total Reports:* {total}")
     st.sidebar.markdown(f"🔥 *Current Streak:* {streak} days")
-    tokens = get_user_tokens(st.session_state.username, BASE_DIR)
+    tokens = data["tokens"]
     st.sidebar.markdown(f"💰 *Tokens:* {tokens}")
     max_tokens = 50
     st.sidebar.write("🎯 *Progress towards goal*")
     st.sidebar.progress(min(tokens / max_tokens, 1.0))
 
-def show_leaderboard_sidebar():
-    reports = load_reports()
-    counts = {}
-    for r in reports:
-        if not isinstance(r, dict):
-            continue
-        user = r.get('username','Unknown')
-        counts[user] = counts.get(user,0) + 1
-    if not counts:
+def show_leaderboard_sidebar(data):
+    sorted_users = data["leaderboard"]
+    if not sorted_users:
         return
     st.sidebar.markdown("## 🏆 Top Contributors")
-    sorted_users = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:5]
     medals = ['🥇','🥈','🥉']
     for idx, (user, cnt) in enumerate(sorted_users, start=1):
         medal = medals[idx-1] if idx <= 3 else '•'
         st.sidebar.write(f"{medal} *{user}* — {cnt} reports")
 
+def show_metrics_panel():
+    with st.sidebar.expander("⏱ Performance"):
+        collect = st.checkbox("Collect timings", value=metrics.enabled(), key="metrics_enabled")
+        if collect != metrics.enabled():
+            metrics.enable(collect)
+        breakdown, elapsed = metrics.rerun_breakdown()
+        if elapsed is not None:
+            st.caption(f"This rerun so far: {elapsed:.1f} ms")
+        if breakdown:
+            rows = sorted(breakdown.items(), key=lambda item: -item[1][1])
+            st.table([{"span": name, "calls": count, "ms": round(total, 2)} for name, (count, total) in rows])
+        snap = metrics.snapshot()
+        if snap["timings"]:
+            st.caption(f"Rolling percentiles (last {metrics.WINDOW} calls)")
+            st.table([dict(span=name, **t) for name, t in sorted(snap["timings"].items())])
+        if snap["counters"]:
+            st.json(snap["counters"])
+        st.download_button("Download metrics", metrics.render_prometheus(), file_name="swachhmap_metrics.txt")
+
+def show_analytics_view():
+    from analytics import get_analytics
+    st.subheader("📊 Hotspots & Backlog")
+    engine = get_analytics(BASE_DIR)
+    stats = engine.resolution_stats()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Open reports", stats["open"])
+    c2.metric("Median time to resolve", f"{stats['p50_hours']} h" if "p50_hours" in stats else "—")
+    c3.metric("p90 time to resolve", f"{stats['p90_hours']} h" if "p90_hours" in stats else "—")
+    c4.metric("p95 time to resolve", f"{stats['p95_hours']} h" if "p95_hours" in stats else "—")
+    include_resolved = st.checkbox("Include resolved reports in hotspots", value=False)
+    hotspots = engine.hotspots(top=10, open_only=not include_resolved)
+    if not hotspots:
+        st.info("No located reports yet.")
+        return
+    st.markdown("**Density hotspots**")
+    st.map([{"lat": h["lat"], "lon": h["lon"], "size": 100 + 50 * h["reports"]} for h in hotspots],
+           latitude="lat", longitude="lon", size="size")
+    st.dataframe(hotspots, use_container_width=True)
+    st.markdown(f"**Busiest cells** (~{engine.cell_deg * 111:.1f} km grid)")
+    st.dataframe(engine.backlog(), use_container_width=True)
+
+def notify_changes(deltas):
+    # toasts for what other sessions changed since this session's last rerun
+    me = st.session_state.username
+    new_reports = sum(1 for kind, r, _ in deltas if kind == "add" and r.get("username") != me)
+    if new_reports:
+        st.toast(f"🆕 {new_reports} new report(s) submitted")
+    seen = set()
+    for kind, r, fields in reversed(deltas):
+        # background patches (e.g. geocoded lat/lon) are not worth a toast
+        if kind == "update" and "status" in fields and r.get("username") == me and me != "admin" and r["id"] not in seen:
+            seen.add(r["id"])
+            st.toast(f"📌 Your report at {r.get('location', 'N/A')} is now {r.get('status', 'Pending')}")
+
 def main_app():
+    from shared import get_shared_state
     apply_custom_styles()
+    changed, deltas = get_shared_state(BASE_DIR).sync(st.session_state)
+    if deltas:
+        notify_changes(deltas)
     st.sidebar.success(f"Logged in as: {st.session_state.username}")
-    show_user_stats_sidebar()
-    show_leaderboard_sidebar()
+    data = sidebar_data(changed)
+    show_user_stats_sidebar(data)
+    show_leaderboard_sidebar(data)
     if st.sidebar.button("🚪 Logout"):
         st.session_state.logged_in = False
         st.session_state.username = ""
@@ -440,7 +572,9 @@ def main_app():
     if "main_tab" not in st.session_state:
         st.session_state.main_tab = "report"
     tab_map = {"report":"📝 Report Issue","view":"📂 View Reports","map":"🗺 Map View"}
-    cols = st.columns(3, gap='large')
+    if st.session_state.username == 'admin':
+        tab_map["analytics"] = "📊 Hotspots"
+    cols = st.columns(len(tab_map), gap='large')
     tab_keys = list(tab_map.keys())
     for i, key in enumerate(tab_keys):
         selected = "selected" if st.session_state.main_tab == key else ""
@@ -454,3 +588,7 @@ def main_app():
         show_view_reports()
     elif st.session_state.main_tab == 'map':
         show_map_view()
+    elif st.session_state.main_tab == 'analytics' and st.session_state.username == 'admin':
+        show_analytics_view()
+    if st.session_state.username == 'admin':
+        show_metrics_panel()
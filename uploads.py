@@ -0,0 +1,148 @@
+import hashlib, os, queue, threading
+from data_store import get_default_files, get_report_store
+from metrics import timed
+
+THUMB_WIDTH = 300
+THUMB_DIR = "thumbs"
+
+# Uploads are stored once per distinct content under uploads/<h[:2]>/<hash><ext>;
+# the report's `image` field keeps that relative name. Older reports still
+# reference flat timestamp-prefixed files, which resolve the same way.
+def content_name(data, original_name):
+    ext = os.path.splitext(original_name or "")[1].lower() or ".jpg"
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest}{ext}"
+
+def image_path(base_dir, image):
+    return os.path.join(get_default_files(base_dir)["UPLOAD_DIR"], image)
+
+def thumb_path(base_dir, image, ext=".jpg"):
+    stem = os.path.splitext(os.path.basename(image))[0]
+    return os.path.join(get_default_files(base_dir)["UPLOAD_DIR"], THUMB_DIR, f"{stem}_{THUMB_WIDTH}{ext}")
+
+@timed("upload.store")
+def store_upload(base_dir, data, original_name):
+    name = content_name(data, original_name)
+    path = image_path(base_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return name
+
+@timed("upload.thumbnail")
+def make_thumbnail(base_dir, image, webp=False):
+    # Pillow is only needed here, so it is imported on first use
+    from PIL import Image, ImageOps
+    src = image_path(base_dir, image)
+    dest = thumb_path(base_dir, image)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((THUMB_WIDTH, THUMB_WIDTH * 4))
+        im = im.convert("RGB")
+        im.save(dest + ".tmp", "JPEG", quality=80, optimize=True)
+        os.replace(dest + ".tmp", dest)
+        if webp:
+            webp_dest = thumb_path(base_dir, image, ".webp")
+            im.save(webp_dest + ".tmp", "WEBP", quality=75)
+            os.replace(webp_dest + ".tmp", webp_dest)
+    return dest
+
+@timed("upload.display_path")
+def display_path(base_dir, image):
+    # thumbnail when ready, otherwise the original (and queue the thumbnail)
+    thumb = thumb_path(base_dir, image)
+    if os.path.exists(thumb):
+        return thumb
+    original = image_path(base_dir, image)
+    if not os.path.exists(original):
+        return None
+    get_thumbnailer(base_dir).submit(image)
+    return original
+
+# Single background worker so thumbnailing never runs in the request path.
+class Thumbnailer:
+    def __init__(self, base_dir, webp=False):
+        self.base_dir = base_dir
+        self.webp = webp
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, image):
+        with self._lock:
+            if image in self._pending:
+                return
+            self._pending.add(image)
+            self._queue.put(image)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="thumbnail-worker", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                image = self._queue.get(timeout=5)
+            except queue.Empty:
+                # decide to exit under the lock submit() holds, so nothing can
+                # be queued between the last get() and the worker going away
+                with self._lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+            try:
+                if not os.path.exists(thumb_path(self.base_dir, image)):
+                    make_thumbnail(self.base_dir, image, self.webp)
+            except Exception:
+                pass
+            with self._lock:
+                self._pending.discard(image)
+
+_thumbnailers = {}
+_thumbnailers_lock = threading.Lock()
+
+def get_thumbnailer(base_dir):
+    key = os.path.abspath(base_dir)
+    with _thumbnailers_lock:
+        if key not in _thumbnailers:
+            _thumbnailers[key] = Thumbnailer(base_dir)
+        return _thumbnailers[key]
+
+def dedupe_uploads(base_dir):
+    # one-off: move flat legacy uploads into the content-addressed layout
+    store = get_report_store(base_dir)
+    moved, freed = {}, 0
+    for report in store.all():
+        image = report.get("image")
+        if not image or "/" in image:
+            continue
+        if image not in moved:
+            path = image_path(base_dir, image)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            name = content_name(data, image)
+            target = image_path(base_dir, name)
+            if os.path.exists(target):
+                os.remove(path)
+                freed += len(data)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+            moved[image] = name
+        store.update(report["id"], image=moved[image])
+    return len(moved), freed
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Deduplicate uploaded images into the content-addressed layout.")
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+    files, freed = dedupe_uploads(args.base_dir)
+    print(f"Moved {files} upload(s), freed {freed} bytes.")